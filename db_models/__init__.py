@@ -1,4 +1,6 @@
-from sqlmodel import SQLModel, Field
+from datetime import datetime
+
+from sqlmodel import SQLModel, Field, func
 
 # Box
 class BoxDB(SQLModel, table = True):
@@ -35,6 +37,7 @@ class InjectDB(SQLModel, table=True):
     rubric: str
 
 # InjectReport
+# updated is set by DB triggers on every insert and update, whoever makes it
 class InjectReportDB(SQLModel, table=True):
     __tablename__ = 'injectreports'
 
@@ -42,6 +45,13 @@ class InjectReportDB(SQLModel, table=True):
     inject_num: int = Field(foreign_key='injects.id', primary_key=True)
     score: int
     breakdown: str
+    updated: datetime | None = Field(
+        default=None,
+        index=True,
+        sa_column_kwargs={
+            'server_default': func.now()
+        }
+    )
 
 # Score reports
 class ScoreReportDB(SQLModel, table=True):
@@ -52,6 +62,32 @@ class ScoreReportDB(SQLModel, table=True):
     score: int
     msg: str
 
+# Score index
+# A team's running scores as of the end of a round, so a past scoreboard is a lookup instead of a scan of the score reports
+# services is a JSON object of {service: [points, penalty points]} as of the round
+# Any two rows for a team can be subtracted to get the scores earned between those rounds
+class ScoreIndexDB(SQLModel, table=True):
+    __tablename__ = 'scoreindex'
+
+    round: int = Field(primary_key=True)
+    team_id: int = Field(foreign_key='teams.identifier', primary_key=True, index=True)
+    total_score: int
+    raw_score: int
+    penalty_score: int
+    services: str
+
+# Round results
+# Pass/fail result of every score check in a round, as a bit-packed matrix with a row per team and a column per service
+# team_ids and services are JSON lists giving the matrix row and column order
+class RoundResultsDB(SQLModel, table=True):
+    __tablename__ = 'roundresults'
+
+    round: int = Field(primary_key=True)
+    team_ids: str
+    services: str
+    results: bytes
+    excluded: bool = Field(default=False)
+
 # SLA Report
 class SLAReportDB(SQLModel, table=True):
     __tablename__ = 'slareports'
@@ -89,8 +125,18 @@ class SettingsDB(SQLModel, table=True):
     check_time: int = Field(default=30)
     check_jitter: int = Field(default=0, ge=0)
     check_timeout: int = Field(default=5, ge=5)
+    check_spread: int = Field(default=0, ge=0)
+    fixed_cadence: bool = Field(default=False)
     check_points: int = Field(default=10, ge=1)
     sla_requirement: int = Field(default=5, ge=1)
     sla_penalty: int = Field(default=100, ge=0)
     first_octets: str = Field(default='10.10')
-    first_pod_third_octet: int = Field(default=1, ge=1, le=255)
\ No newline at end of file
+    first_pod_third_octet: int = Field(default=1, ge=1, le=255)
+
+# Config version
+# Counters bumped by DB triggers whenever a config table changes, so the engine can spot changes without reading the table
+class ConfigVersionDB(SQLModel, table=True):
+    __tablename__ = 'configversions'
+
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
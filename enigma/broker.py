@@ -1,4 +1,10 @@
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from itertools import count
 from os import getenv
+from types import SimpleNamespace
 from dotenv import load_dotenv
 
 import pika
@@ -7,7 +13,46 @@ from enigma.logger import log
 
 load_dotenv(override=True)
 
-class RabbitMQ:
+# Message broker backend
+# 'rabbitmq'    connects to RabbitMQ, needed when anything outside this machine sends or takes messages
+# 'local'       routes messages in this process, for single-node competitions, benchmarks and testing
+#               check results from local worker processes are handed back to the engine over a pipe
+broker_backend = getenv('ENIGMA_BROKER', 'rabbitmq')
+
+# Abstract class Broker
+# Every backend exposes a pika style channel and connection, so callers do not care which one they have
+# channel       exchange_declare, queue_declare, queue_bind, basic_publish, basic_qos, basic_consume,
+#               basic_ack, start_consuming and stop_consuming
+# connection    process_data_events, call_later, remove_timeout, is_closed and close
+class Broker(ABC):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @abstractmethod
+    def connect(self):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    # Connects to the backend selected by ENIGMA_BROKER
+    @classmethod
+    def new(cls):
+        match broker_backend:
+            case 'rabbitmq':
+                return RabbitMQ()
+            case 'local':
+                return LocalBroker()
+            case _:
+                log.critical(f'Unknown broker backend {broker_backend}!')
+                raise SystemExit(1)
+
+class RabbitMQ(Broker):
 
     def __init__(self):
         self.user = getenv('RABBITMQ_DEFAULT_USER', 'guest')
@@ -23,12 +68,6 @@ class RabbitMQ:
         )
         log.debug('RabbitMQ connection established')
 
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
-
     def connect(self):
         credentials = pika.PlainCredentials(self.user, self.password)
         parameters = pika.ConnectionParameters(
@@ -40,4 +79,231 @@ class RabbitMQ:
 
     def close(self):
         if self.connection and not self.connection.is_closed:
-            self.connection.close()
\ No newline at end of file
+            self.connection.close()
+
+#######################
+# Local broker
+
+# Checks a routing key against a topic binding, both split into words
+# '*' matches exactly one word and '#' matches zero or more words, the same as a RabbitMQ topic exchange
+def topic_matches(pattern: tuple[str], words: tuple[str]) -> bool:
+    if not pattern:
+        return not words
+    if pattern[0] == '#':
+        return any(topic_matches(pattern[1:], words[i:]) for i in range(len(words) + 1))
+    if not words or (pattern[0] != '*' and pattern[0] != words[0]):
+        return False
+    return topic_matches(pattern[1:], words[1:])
+
+# Local router
+# Holds the queues and topic bindings shared by every local broker connection in this process
+# The queues a routing key goes to are cached, and the cache is cleared whenever bindings change
+class LocalRouter:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.bindings = {}
+        self.routes = {}
+        self.names = count()
+
+    def __repr__(self):
+        return '<{}> with {} queues'.format(type(self).__name__, len(self.queues))
+
+    def declare_exchange(self, exchange: str, exchange_type: str):
+        if exchange_type != 'topic':
+            log.warning(f'Local broker exchange {exchange} is routed as a topic exchange, not {exchange_type}')
+        with self.lock:
+            self.bindings.setdefault(exchange, [])
+
+    # Creates a queue if it does not exist and returns its name
+    # A queue with no name gets a generated one, as with RabbitMQ
+    def declare_queue(self, name: str) -> str:
+        with self.lock:
+            if not name:
+                name = f'local.gen-{next(self.names)}'
+            self.queues.setdefault(name, queue.Queue())
+        return name
+
+    def delete_queue(self, name: str):
+        with self.lock:
+            self.queues.pop(name, None)
+            for exchange, bindings in self.bindings.items():
+                self.bindings[exchange] = [binding for binding in bindings if binding[1] != name]
+            self.routes.clear()
+
+    def bind_queue(self, exchange: str, name: str, routing_key: str):
+        with self.lock:
+            self.bindings.setdefault(exchange, []).append((tuple(routing_key.split('.')), name))
+            self.routes.clear()
+
+    def get_queue(self, name: str) -> queue.Queue:
+        return self.queues[name]
+
+    # Puts a message on every queue bound to the routing key
+    # The default exchange '' sends it straight to the queue named by the routing key
+    # Messages that match no queue are dropped, as with RabbitMQ
+    def publish(self, exchange: str, routing_key: str, body: bytes, properties=None):
+        with self.lock:
+            key = (exchange, routing_key)
+            if key not in self.routes:
+                if exchange == '':
+                    self.routes[key] = [routing_key] if routing_key in self.queues else []
+                else:
+                    words = tuple(routing_key.split('.'))
+                    self.routes[key] = list(dict.fromkeys(
+                        name for pattern, name in self.bindings.get(exchange, []) if topic_matches(pattern, words)
+                    ))
+            targets = [self.queues[name] for name in self.routes[key]]
+        for target in targets:
+            target.put((routing_key, properties, body))
+
+local_router = LocalRouter()
+
+# Pipe that local worker processes publish to instead of their own router
+# Set in worker processes only, the engine forwards everything on it to its router
+local_bridge = None
+
+def set_local_bridge(bridge):
+    global local_bridge
+    local_bridge = bridge
+
+# Forwards messages from local worker processes to this process's router until None is received
+def forward_local_bridge(bridge):
+    while True:
+        message = bridge.get()
+        if message is None:
+            break
+        local_router.publish(*message)
+
+# pika style channel over the local router
+class LocalChannel:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.consumers = {}
+        self.exclusive = []
+        self.consuming = False
+        self.delivery_tags = count(1)
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'direct', **kwargs):
+        local_router.declare_exchange(exchange, exchange_type)
+
+    # Exclusive queues are deleted when the connection closes
+    def queue_declare(self, queue: str = '', exclusive: bool = False, **kwargs):
+        name = local_router.declare_queue(queue)
+        if exclusive:
+            self.exclusive.append(name)
+        return SimpleNamespace(method=SimpleNamespace(queue=name))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str = None, **kwargs):
+        local_router.bind_queue(exchange, queue, routing_key if routing_key is not None else queue)
+
+    def basic_publish(self, exchange: str, routing_key: str, body: str | bytes, properties=None, **kwargs):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if local_bridge is not None:
+            local_bridge.put((exchange, routing_key, body))
+        else:
+            local_router.publish(exchange, routing_key, body, properties)
+
+    # Messages are handed over in memory, so there is nothing to limit or acknowledge
+    def basic_qos(self, prefetch_count: int = 0, **kwargs):
+        pass
+
+    def basic_ack(self, delivery_tag: int = 0, **kwargs):
+        pass
+
+    def basic_consume(self, queue: str, on_message_callback, auto_ack: bool = False, **kwargs) -> str:
+        consumer_tag = f'local.ctag-{len(self.consumers)}'
+        self.consumers[consumer_tag] = (local_router.get_queue(queue), on_message_callback)
+        return consumer_tag
+
+    # Delivers messages to the consumers until stop_consuming() is called
+    # Timers set with connection.call_later() run in between deliveries
+    # With one consumer the loop sleeps on its queue, otherwise the queues are polled
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming and self.consumers:
+            timeout = min(self.connection.run_timers(), 0.5)
+            if not self.consuming:
+                break
+            consumers = list(self.consumers.values())
+            delivered = False
+            for consumer_queue, callback in consumers:
+                try:
+                    routing_key, properties, body = consumer_queue.get(timeout=timeout if len(consumers) == 1 else 0)
+                except queue.Empty:
+                    continue
+                delivered = True
+                method = SimpleNamespace(delivery_tag=next(self.delivery_tags), routing_key=routing_key)
+                callback(self, method, properties, body)
+                if not self.consuming:
+                    break
+            if not delivered and len(consumers) > 1:
+                time.sleep(min(timeout, 0.01))
+
+    def stop_consuming(self):
+        self.consuming = False
+
+    def close(self):
+        self.consuming = False
+        for name in self.exclusive:
+            local_router.delete_queue(name)
+        self.exclusive = []
+
+# pika style connection for the local broker
+class LocalConnection:
+
+    def __init__(self):
+        self.is_closed = False
+        self.timers = {}
+        self.timer_ids = count()
+
+    # Runs any timers that are due and returns the seconds until the next one
+    def run_timers(self) -> float:
+        now = time.monotonic()
+        for timer_id, (when, callback) in sorted(self.timers.items(), key=lambda timer: timer[1][0]):
+            if when > now:
+                return when - now
+            del self.timers[timer_id]
+            callback()
+        return 0.5
+
+    def process_data_events(self, time_limit: float = 0):
+        self.run_timers()
+
+    def call_later(self, delay: float, callback) -> int:
+        timer_id = next(self.timer_ids)
+        self.timers[timer_id] = (time.monotonic() + delay, callback)
+        return timer_id
+
+    def remove_timeout(self, timer_id: int):
+        self.timers.pop(timer_id, None)
+
+    def close(self):
+        self.is_closed = True
+
+# In-process broker
+# Routes messages between the threads of this process with the same topic semantics as the 'enigma' exchange
+class LocalBroker(Broker):
+
+    def __init__(self):
+        self.connection = None
+        self.channel = None
+        self.connect()
+
+        self.channel.exchange_declare(
+            exchange='enigma',
+            exchange_type='topic'
+        )
+        log.debug('Local broker connection established')
+
+    def connect(self):
+        self.connection = LocalConnection()
+        self.channel = LocalChannel(self.connection)
+
+    def close(self):
+        if self.connection and not self.connection.is_closed:
+            self.channel.close()
+            self.connection.close()
@@ -1,14 +1,25 @@
-import random
+import asyncio
 from abc import ABC, abstractmethod
 
+# Seconds a check waits on its target before giving up
+# The engine cancels checks at the check timeout anyway, this keeps a stuck connection from holding a worker forever
+connect_timeout = 10
+
 # Abstract class Service
 # All services are derived from Service
 # Add any Service classes to this file or to a file importing Service from enigma.checks
+# Services use __slots__ so the instances shared by every team stay small
+# Subclasses must list every attribute they set in __init__ in their own __slots__
 class Service(ABC):
 
+    __slots__ = ()
+
     # Attribute name should be the name of the service
     name = 'service'
 
+    # Set needs_round if the check needs the round number, it is then passed to new() as data['round']
+    needs_round = False
+
     # The __init__ must contain the specified parameters for the service
     # __init__ should test the parameters for proper use and raise a log.critical() if something isn't right
     @abstractmethod
@@ -37,6 +48,12 @@ class Service(ABC):
     @abstractmethod
     def conduct_service_check(self, addr: str) -> tuple[bool, str]:
         pass
+
+    # Async version of conduct_service_check(), used when checks are run by the asyncio check runtime
+    # Checks that spend most of their time waiting on the network should override this so one worker can run many at once
+    # If it is not overridden, the blocking conduct_service_check() is run in a thread instead
+    async def conduct_service_check_async(self, addr: str) -> tuple[bool, str]:
+        return await asyncio.to_thread(self.conduct_service_check, addr)
     
     # Service.new(data) is called to create a new Service object with all of the proper parameters assigned
     # A dict 'data' is passed. Each key in 'data' should refer to a parameter in the __init__
@@ -1,13 +1,30 @@
-import random
-import time
+import ssl
+import asyncio
+import http.client
 
-from enigma.checks import Service
+from enigma.checks import Service, connect_timeout
 from enigma.logger import log
 
+# TLS settings for HTTPS checks
+# Competition boxes serve self-signed certs, so certs are not verified
+tls_context = ssl.create_default_context()
+tls_context.check_hostname = False
+tls_context.verify_mode = ssl.CERT_NONE
+
+# Sends a GET request over an open connection and reads back the status code
+async def get_status(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, addr: str, path: str) -> int:
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {addr}\r\nConnection: close\r\n\r\n'.encode('utf-8'))
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return int(status_line.split()[1])
+
 # Performs a simple HTTP check
 # If an HTTP GET request is OK, the check passes
 class HTTPService(Service):
 
+    __slots__ = ('port', 'path')
+
     name = 'http'
 
     def __init__(self, port: int, path: str):
@@ -17,7 +34,7 @@ class HTTPService(Service):
 
     def __repr__(self):
         return '<{}> with port {}'.format(type(self).__name__, self.port)
-    
+
     def __eq__(self, obj):
         if isinstance(obj, HTTPService):
             if self.port == obj.port:
@@ -29,12 +46,31 @@ class HTTPService(Service):
         return False
 
     def conduct_service_check(self, addr: str) -> tuple[bool, str]:
-        # TODO: make it not random
-        log.warning('Check is not fully implemented! Results are random')
         log.info('Conducting http service check')
-        time.sleep(random.randint(1,10))
-        result = random.choice([True, False])
-        return result, 'randomly generated message'
+        connection = http.client.HTTPConnection(addr, int(self.port), timeout=connect_timeout)
+        try:
+            connection.request('GET', getattr(self, 'path', '/'))
+            status = connection.getresponse().status
+        except (OSError, http.client.HTTPException) as e:
+            return False, f'Connection failed: {e}'
+        finally:
+            connection.close()
+        return status == 200, f'HTTP {status}'
+
+    async def conduct_service_check_async(self, addr: str) -> tuple[bool, str]:
+        log.info('Conducting http service check')
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(addr, int(self.port)),
+                timeout=connect_timeout
+            )
+            status = await asyncio.wait_for(
+                get_status(reader, writer, addr, getattr(self, 'path', '/')),
+                timeout=connect_timeout
+            )
+        except (OSError, ValueError, IndexError, TimeoutError) as e:
+            return False, f'Connection failed: {e}'
+        return status == 200, f'HTTP {status}'
 
     @classmethod
     def new(cls, data: dict):
@@ -42,11 +78,13 @@ class HTTPService(Service):
             data['port'] if 'port' in data else 80,
             data['path'] if 'path' in data else None
         )
-    
+
 # Performs a simple HTTPS check
 # If an HTTPS GET request is OK, the check passes
 class HTTPSService(Service):
 
+    __slots__ = ('port', 'path')
+
     name = 'https'
 
     def __init__(self, port: int, path: str):
@@ -56,7 +94,7 @@ class HTTPSService(Service):
 
     def __repr__(self):
         return '<{}> with port {}'.format(type(self).__name__, self.port)
-    
+
     def __eq__(self, obj):
         if isinstance(obj, HTTPSService):
             if self.port == obj.port:
@@ -68,16 +106,35 @@ class HTTPSService(Service):
         return False
 
     def conduct_service_check(self, addr: str) -> tuple[bool, str]:
-        # TODO: make it not random
-        log.warning('Check is not fully implemented! Results are random')
         log.info('Conducting https service check')
-        time.sleep(random.randint(1,10))
-        result = random.choice([True, False])
-        return result, 'randomly generated message'
+        connection = http.client.HTTPSConnection(addr, int(self.port), timeout=connect_timeout, context=tls_context)
+        try:
+            connection.request('GET', getattr(self, 'path', '/'))
+            status = connection.getresponse().status
+        except (OSError, http.client.HTTPException) as e:
+            return False, f'Connection failed: {e}'
+        finally:
+            connection.close()
+        return status == 200, f'HTTPS {status}'
+
+    async def conduct_service_check_async(self, addr: str) -> tuple[bool, str]:
+        log.info('Conducting https service check')
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(addr, int(self.port), ssl=tls_context),
+                timeout=connect_timeout
+            )
+            status = await asyncio.wait_for(
+                get_status(reader, writer, addr, getattr(self, 'path', '/')),
+                timeout=connect_timeout
+            )
+        except (OSError, ValueError, IndexError, TimeoutError) as e:
+            return False, f'Connection failed: {e}'
+        return status == 200, f'HTTPS {status}'
 
     @classmethod
     def new(cls, data: dict):
         return cls(
-            data['port'] if 'port' in data else 80,
+            data['port'] if 'port' in data else 443,
             data['path'] if 'path' in data else None
-        )
\ No newline at end of file
+        )
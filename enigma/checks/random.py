@@ -1,5 +1,6 @@
 import random
 import time
+import asyncio
 
 from enigma.checks import Service
 from enigma.logger import log
@@ -7,8 +8,13 @@ from enigma.logger import log
 # Performs a random check
 class RandomService(Service):
 
+    __slots__ = ()
+
     name = 'random'
 
+    def __init__(self):
+        pass
+
     def __repr__(self):
         return '<{}> which will randomly give you a pass/fail'.format(type(self).__name__)
 
@@ -22,6 +28,12 @@ class RandomService(Service):
         time.sleep(random.randint(1,10))
         result = random.choice([True, False])
         return (result, 'randomly generated message')
+
+    async def conduct_service_check_async(self, addr: str) -> tuple[bool, str]:
+        log.info('Conducting Random service check')
+        await asyncio.sleep(random.randint(1,10))
+        result = random.choice([True, False])
+        return (result, 'randomly generated message')
     
     @classmethod
     def new(cls, data: dict):
@@ -1,19 +1,31 @@
-import random
-import time
+import ast
+import asyncio
 
-from enigma.checks import Service
+import asyncssh
+
+from enigma.checks import Service, connect_timeout
 from enigma.logger import log
 
-# Performs a simple SSH connection service check
-# If a connection is established, the check passes
+# Performs an SSH login service check
+# The check logs in with a cred picked from the team's credlists, once for every configured auth method
+# 'plaintext' logs in with the cred's password and 'pubkey' logs in as the cred's user with the keyfile
+# If every auth method logs in, the check passes
+# Host keys are not verified, since competition boxes are rebuilt with new keys
 class SSHService(Service):
 
+    __slots__ = ('credlist', 'creds', 'port', 'auth', 'keyfile')
+
     name = 'ssh'
 
-    def __init__(self, credlist: list[str], port: int, auth: list[str], keyfile: str):
-        if not credlist:
+    # The engine creates SSHService from the box config with a credlist,
+    # check workers create it from the check options with the creds picked for the check
+    def __init__(self, credlist: list[str], port: int, auth: list[str], keyfile: str, creds: dict = None):
+        if not credlist and not creds:
             raise SystemExit(0)
-        self.credlist = credlist
+        if credlist:
+            self.credlist = credlist
+        if creds:
+            self.creds = creds
         self.port = port
         if auth is None:
             self.auth = ['plaintext']
@@ -27,31 +39,66 @@ class SSHService(Service):
 
     def __repr__(self):
         return '<{}> with port {} and auth methods {}'.format(type(self).__name__, self.port, self.auth)
-    
+
     def __eq__(self, obj):
         if isinstance(obj, SSHService):
             if (self.port == obj.port
-                and self.credlist == obj.credlist
+                and getattr(self, 'credlist', None) == getattr(obj, 'credlist', None)
                 and self.auth == obj.auth
+                and getattr(self, 'keyfile', None) == getattr(obj, 'keyfile', None)
             ):
-                if hasattr(self, 'keyfile') and hasattr(obj, 'keyfile'):
-                    if self.keyfile == obj.keyfile:
-                        return True
+                return True
         return False
 
     def conduct_service_check(self, addr: str) -> tuple[bool, str]:
-        # TODO: make it not random
-        log.warning('Check is not fully implemented! Results are random')
+        return asyncio.run(self.conduct_service_check_async(addr))
+
+    async def conduct_service_check_async(self, addr: str) -> tuple[bool, str]:
         log.info('Conducting ssh service check')
-        time.sleep(random.randint(1,10))
-        result = random.choice([True, False])
-        return result, 'randomly generated message'
+        if not hasattr(self, 'creds'):
+            return False, 'No creds to log in with'
+        user, password = next(iter(self.creds.items()))
+        for auth in self.auth:
+            options = {
+                'port': int(self.port),
+                'username': user,
+                'known_hosts': None,
+                'connect_timeout': connect_timeout,
+                'login_timeout': connect_timeout
+            }
+            match auth:
+                case 'plaintext':
+                    options['password'] = password
+                    options['client_keys'] = None
+                case 'pubkey':
+                    if not self.keyfile:
+                        return False, 'No keyfile for pubkey auth'
+                    options['client_keys'] = [self.keyfile]
+                    options['preferred_auth'] = 'publickey'
+                case _:
+                    return False, f'Unknown auth method {auth}'
+            try:
+                async with asyncssh.connect(addr, **options):
+                    pass
+            except asyncssh.PermissionDenied:
+                return False, f'Login as {user} with {auth} auth was denied'
+            except (OSError, asyncssh.Error, TimeoutError) as e:
+                return False, f'Connection failed: {e}'
+        return True, f'Logged in as {user} with {", ".join(self.auth)} auth'
 
+    # auth and creds arrive as strings in check options, as written by the check plan
     @classmethod
     def new(cls, data: dict):
+        auth = data['auth'] if 'auth' in data else ['plaintext']
+        if isinstance(auth, str):
+            auth = ast.literal_eval(auth)
+        creds = data['creds'] if 'creds' in data else None
+        if isinstance(creds, str):
+            creds = ast.literal_eval(creds)
         return cls(
             data['credlist'] if 'credlist' in data else None,
             data['port'] if 'port' in data else 22,
-            data['auth'] if 'auth' in data else ['plaintext'],
-            data['keyfile'] if 'keyfile' in data else None
-        )
\ No newline at end of file
+            auth,
+            data['keyfile'] if 'keyfile' in data else None,
+            creds
+        )
@@ -0,0 +1,134 @@
+import json
+import math
+import time
+import random
+import asyncio
+
+from enigma.checks import Service
+from enigma.logger import log
+
+# Synthetic check for benchmarks and load testing
+# Does not touch the network, it waits for a modelled latency and then reports a modelled result
+# Every result is drawn from a random generator seeded by the model seed, the check address and the round,
+# so the same competition gives the same results every time it is run, in any order
+#
+# Model options, all optional
+# latency         base latency in seconds, default 0
+# latency_model   'fixed' always waits latency
+#                 'normal' waits a normal amount around latency with a standard deviation of latency_spread
+#                 'longtail' waits a log-normal amount with a median of latency, latency_spread sets how long the tail is
+# latency_spread  see latency_model, default 0
+# pass_rate       chance that a check passes, default 1
+# fail_teams      team identifiers whose checks always fail
+# flap_period     rounds the service stays up and then down, 0 for never, default 0
+#                 each team starts its flapping at its own point
+# outage_rate     chance that an outage starts in a round, default 0
+#                 an outage is shared by every team, so their checks fail together
+# outage_length   rounds an outage lasts, default 1
+# seed            seed for the model, default 0
+class SyntheticService(Service):
+
+    __slots__ = (
+        'model',
+        'latency',
+        'latency_model',
+        'latency_spread',
+        'pass_rate',
+        'fail_teams',
+        'flap_period',
+        'outage_rate',
+        'outage_length',
+        'seed',
+        'round'
+    )
+
+    name = 'synthetic'
+
+    needs_round = True
+
+    latency_models = ('fixed', 'normal', 'longtail')
+
+    def __init__(self, model: dict, round: int):
+        self.model = model
+        self.latency = float(model.get('latency', 0))
+        self.latency_model = model.get('latency_model', 'fixed')
+        self.latency_spread = float(model.get('latency_spread', 0))
+        self.pass_rate = float(model.get('pass_rate', 1))
+        self.fail_teams = [int(team) for team in model.get('fail_teams', [])]
+        self.flap_period = int(model.get('flap_period', 0))
+        self.outage_rate = float(model.get('outage_rate', 0))
+        self.outage_length = int(model.get('outage_length', 1))
+        self.seed = model.get('seed', 0)
+        self.round = round
+        if self.latency_model not in self.latency_models:
+            log.critical(f'Unknown synthetic latency model {self.latency_model}!')
+            raise SystemExit(0)
+
+    def __repr__(self):
+        return '<{}> with {} latency {}'.format(type(self).__name__, self.latency_model, self.latency)
+
+    def __eq__(self, obj):
+        if isinstance(obj, SyntheticService):
+            return self.model == obj.model
+        return False
+
+    # Works out the latency and result of the check on addr for this round
+    # The pass draw is taken first, so changing the latency model does not change which checks pass
+    def get_outcome(self, addr: str) -> tuple[float, bool, str]:
+        generator = random.Random(f'{self.seed}|{addr}|{self.round}')
+        draw = generator.random()
+
+        match self.latency_model:
+            case 'fixed':
+                latency = self.latency
+            case 'normal':
+                latency = max(generator.gauss(self.latency, self.latency_spread), 0)
+            case 'longtail':
+                latency = self.latency * math.exp(generator.gauss(0, self.latency_spread))
+
+        team = int(addr.split('.')[2])
+        if team in self.fail_teams:
+            return latency, False, 'Synthetic check failed for team'
+        if self.in_outage():
+            return latency, False, 'Synthetic outage'
+        if self.flap_period > 0:
+            offset = random.Random(f'{self.seed}|{addr}|flap').randrange(self.flap_period * 2)
+            if (self.round + offset) // self.flap_period % 2 == 1:
+                return latency, False, 'Synthetic service flapped down'
+        if draw >= self.pass_rate:
+            return latency, False, 'Synthetic check failed'
+        return latency, True, 'Synthetic check passed'
+
+    # An outage covers this round if one started in this round or in any of the outage_length - 1 rounds before it
+    def in_outage(self) -> bool:
+        if self.outage_rate <= 0:
+            return False
+        for start in range(self.round - self.outage_length + 1, self.round + 1):
+            if random.Random(f'{self.seed}|outage|{start}').random() < self.outage_rate:
+                return True
+        return False
+
+    def conduct_service_check(self, addr: str) -> tuple[bool, str]:
+        log.debug('Conducting synthetic service check')
+        latency, result, msg = self.get_outcome(addr)
+        if latency > 0:
+            time.sleep(latency)
+        return result, msg
+
+    async def conduct_service_check_async(self, addr: str) -> tuple[bool, str]:
+        log.debug('Conducting synthetic service check')
+        latency, result, msg = self.get_outcome(addr)
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return result, msg
+
+    # data is either the box config, or the check options with the model as JSON
+    @classmethod
+    def new(cls, data: dict):
+        model = data['model'] if 'model' in data else data
+        if isinstance(model, str):
+            model = json.loads(model)
+        return cls(
+            model,
+            int(data['round']) if 'round' in data else 0
+        )
@@ -0,0 +1,52 @@
+import socket
+import asyncio
+
+from enigma.checks import Service, connect_timeout
+from enigma.logger import log
+
+# Performs a simple TCP connection check
+# If the port accepts a connection, the check passes
+class TCPService(Service):
+
+    __slots__ = ('port',)
+
+    name = 'tcp'
+
+    def __init__(self, port: int):
+        if port is None:
+            raise SystemExit(0)
+        self.port = port
+
+    def __repr__(self):
+        return '<{}> with port {}'.format(type(self).__name__, self.port)
+
+    def __eq__(self, obj):
+        if isinstance(obj, TCPService):
+            return self.port == obj.port
+        return False
+
+    def conduct_service_check(self, addr: str) -> tuple[bool, str]:
+        log.info('Conducting tcp service check')
+        try:
+            socket.create_connection((addr, int(self.port)), timeout=connect_timeout).close()
+        except OSError as e:
+            return False, f'Connection failed: {e}'
+        return True, 'Connected'
+
+    async def conduct_service_check_async(self, addr: str) -> tuple[bool, str]:
+        log.info('Conducting tcp service check')
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(addr, int(self.port)),
+                timeout=connect_timeout
+            )
+            writer.close()
+        except (OSError, TimeoutError) as e:
+            return False, f'Connection failed: {e}'
+        return True, 'Connected'
+
+    @classmethod
+    def new(cls, data: dict):
+        return cls(
+            data['port'] if 'port' in data else None
+        )
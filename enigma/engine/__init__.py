@@ -1,4 +1,4 @@
-from os import getenv, getcwd
+from os import getenv, getcwd, cpu_count
 from dotenv import load_dotenv
 from os.path import join
 
@@ -11,5 +11,37 @@ postgres_settings = {
     'port': getenv('POSTGRES_PORT')
 }
 
+# Database URL
+# Defaults to the PostgreSQL database set by the POSTGRES_ variables
+# Set ENIGMA_DATABASE_URL to use another database, such as 'sqlite:///enigma.db' for single-node events and testing
+database_url = getenv(
+    'ENIGMA_DATABASE_URL',
+    'postgresql+psycopg://{user}:{password}@{host}:{port}/enigma'.format(**postgres_settings)
+)
+
+# Check worker settings
+# executor      'pool' runs checks on a local worker pool, 'async' runs them on a local pool of asyncio workers,
+#               'queue' sends them to worker nodes over RabbitMQ
+# pool_size     number of check worker processes kept alive
+# max_tasks     number of checks a worker runs before it is replaced between rounds, 0 is no limit
+# concurrency   number of checks each asyncio worker runs at once
+worker_settings = {
+    'executor': getenv('ENIGMA_CHECK_EXECUTOR', 'pool'),
+    'pool_size': int(getenv('ENIGMA_WORKERS', cpu_count() * 4)),
+    'max_tasks': int(getenv('ENIGMA_WORKER_MAX_TASKS', 1000)),
+    'concurrency': int(getenv('ENIGMA_WORKER_CONCURRENCY', 100))
+}
+
 static_path = join(getcwd(), 'static')
-checks_path = join(getcwd(), 'enigma')
\ No newline at end of file
+checks_path = join(getcwd(), 'enigma')
+checkpoint_path = getenv('ENIGMA_CHECKPOINT_PATH', join(getcwd(), 'checkpoints'))
+
+# Score export settings
+# format        'csv', 'jsonl' or 'npz' for a compressed columnar file, 'none' turns off exporting during scoring
+# path          directory the score history and team breakdowns are written to
+# chunk_rounds  number of rounds in each 'npz' history file
+export_settings = {
+    'format': getenv('ENIGMA_EXPORT_FORMAT', 'csv'),
+    'path': getenv('ENIGMA_EXPORT_PATH', join(static_path, 'export')),
+    'chunk_rounds': int(getenv('ENIGMA_EXPORT_CHUNK_ROUNDS', 100))
+}
@@ -0,0 +1,76 @@
+import os
+from datetime import datetime
+from os.path import join, exists
+
+import numpy as np
+
+from enigma.logger import log
+from enigma.engine.scoreboard import ScoreBoard
+
+# Checkpoint
+# The engine's in-memory scoring state as of the end of a round
+# Written after every round so a restarted engine can pick up where it left off without replaying score reports
+# The checkpoint is a single .npz file that is written to a temp file and swapped in, so a crash mid-write
+# leaves the previous checkpoint in place
+class Checkpoint:
+
+    filename = 'engine.npz'
+
+    def __init__(self, round: int, state: dict[str: np.ndarray], inject_watermark: datetime | None):
+        self.round = round
+        self.state = state
+        self.inject_watermark = inject_watermark
+
+    def __repr__(self):
+        return '<{}> for round {} with {} teams'.format(
+            type(self).__name__,
+            self.round,
+            len(self.state['team_ids'])
+        )
+
+    # Writes the checkpoint, replacing the last one
+    def write(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        filepath = join(path, self.filename)
+        temp_path = f'{filepath}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(
+                f,
+                round=np.int64(self.round),
+                inject_watermark=np.str_('' if self.inject_watermark is None else self.inject_watermark.isoformat()),
+                **self.state
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+        log.debug(f'Wrote checkpoint for round {self.round}')
+
+    # Loads the scoring state into a scoreboard
+    def restore(self, scoreboard: ScoreBoard):
+        scoreboard.set_state(self.state)
+
+    # Creates a checkpoint from the engine's scoreboard
+    @classmethod
+    def new(cls, round: int, scoreboard: ScoreBoard, inject_watermark: datetime | None):
+        return cls(
+            round=round,
+            state=scoreboard.get_state(),
+            inject_watermark=inject_watermark
+        )
+
+    # Reads the last checkpoint written to path, or None if there is not one
+    @classmethod
+    def read(cls, path: str):
+        filepath = join(path, cls.filename)
+        if not exists(filepath):
+            return None
+        with np.load(filepath, allow_pickle=False) as data:
+            state = {k: data[k] for k in data.files if k not in ('round', 'inject_watermark')}
+            round = int(data['round'])
+            inject_watermark = str(data['inject_watermark'])
+        log.debug(f'Read checkpoint for round {round}')
+        return cls(
+            round=round,
+            state=state,
+            inject_watermark=datetime.fromisoformat(inject_watermark) if inject_watermark else None
+        )
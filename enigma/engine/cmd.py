@@ -1,12 +1,15 @@
-import sched
+import sys
 import threading
 
 from enigma.logger import log
 
-from enigma.broker import RabbitMQ
+from enigma.broker import Broker, broker_backend
+from enigma.engine import export_settings
 from enigma.engine.scoring import ScoringEngine, RvBScoringEngine
+from enigma.engine.export import ScoreExporter
+from enigma.models.settings import Settings
+from enigma.models.roundresults import RoundResults
 
-# TODO: Add event scheduler to create box score start times
 class RvBCMD:
 
     def __init__(self):
@@ -15,22 +18,38 @@ class RvBCMD:
         self.pause = False
 
     def start(self):
-        with RabbitMQ() as rabbit:
-            result = rabbit.channel.queue_declare('cmd_queue', exclusive=True)
-            rabbit.channel.queue_bind(
+        with Broker.new() as broker:
+            result = broker.channel.queue_declare('cmd_queue', exclusive=True)
+            broker.channel.queue_bind(
                 exchange='enigma',
                 queue=result.method.queue,
                 routing_key='enigma.engine.cmd'
             )
-            rabbit.channel.basic_consume(
+            if broker_backend == 'local':
+                threading.Thread(target=self.read_commands, daemon=True).start()
+            broker.channel.basic_consume(
                 queue=result.method.queue,
                 on_message_callback=self.on_command_callback,
                 auto_ack=True
             )
             try:
-                rabbit.channel.start_consuming()
+                broker.channel.start_consuming()
             except KeyboardInterrupt:
-                rabbit.channel.stop_consuming()
+                broker.channel.stop_consuming()
+
+    # With the local broker nothing outside this process can send commands, so they are read from stdin instead
+    # Each line is published to 'enigma.engine.cmd' the same as a command sent over RabbitMQ
+    def read_commands(self):
+        log.info('Reading commands from stdin')
+        with Broker.new() as broker:
+            for line in sys.stdin:
+                cmd = line.strip()
+                if cmd:
+                    broker.channel.basic_publish(
+                        exchange='enigma',
+                        routing_key='enigma.engine.cmd',
+                        body=cmd
+                    )
 
     def on_command_callback(self, channel, method, properties, body):
         log.info(f'Received command: {body.decode('utf-8')}')
@@ -38,18 +57,37 @@ class RvBCMD:
 
     # CMD
     # init          creates RvBScoringEngine object
-    # update        updates engine with latest info
+    # resume        restores scores and round from the last checkpoint, run after init
+    # update        reloads settings and updates engine with latest info
     # set_rounds    sets the number of rounds to run for - 0 is default, no limit
     # start         starts scoring
     # stop          stops scoring
     # pause         pauses/unpauses scoring
+    # pcr           changes a team cred - pcr.<team identifier>.<credlist>.<user>.<password>
+    # exclude       throws out a round when rescoring - exclude.<round>
+    # include       brings back an excluded round - include.<round>
+    # rescore       recomputes all scores from the stored round results with the current settings
+    # export        rewrites the score history and breakdowns - export or export.<csv|jsonl|npz>
     def decode_cmd(self, cmd):
         cmd_args = cmd.split('.')
         match cmd_args[0]:
             case 'init':
                 self.engine = RvBScoringEngine()
                 log.info('Created RvB scoring engine object')
+            case 'resume':
+                if isinstance(self.engine, RvBScoringEngine):
+                    if not self.engine.engine_lock:
+                        if self.engine.resume():
+                            log.info(f'Resuming from round {self.engine.round}')
+                        else:
+                            log.warning('Could not resume from the last checkpoint!')
+                    else:
+                        log.warning('Cannot resume while running!')
+                else:
+                    log.error('Engine does not exist!')
             case 'update':
+                Settings.refresh()
+                log.info('Reloaded settings')
                 if isinstance(self.engine, RvBScoringEngine):
                     if not self.engine.engine_lock:
                         self.engine.update_comp()
@@ -97,4 +135,48 @@ class RvBCMD:
                     else:
                         log.warning('Enigma is not running!')
                 else:
-                    log.error('Engine does not exist!')
\ No newline at end of file
+                    log.error('Engine does not exist!')
+            case 'pcr':
+                if isinstance(self.engine, RvBScoringEngine):
+                    pcr_args = cmd.split('.', 4)
+                    if len(pcr_args) != 5:
+                        log.error('PCR must be in the format pcr.<team identifier>.<credlist>.<user>.<password>')
+                        return
+                    for team in self.engine.teams:
+                        if team.identifier == int(pcr_args[1]):
+                            team.update_cred(pcr_args[2], pcr_args[3], pcr_args[4])
+                            log.info(f'Changed cred {pcr_args[3]} in credlist {pcr_args[2]} for team {team.name}')
+                            break
+                    else:
+                        log.error(f'Team {pcr_args[1]} does not exist!')
+                else:
+                    log.error('Engine does not exist!')
+            case 'exclude' | 'include':
+                if len(cmd_args) != 2 or not cmd_args[1].isdigit():
+                    log.error(f'{cmd_args[0]} must be in the format {cmd_args[0]}.<round>')
+                    return
+                if RoundResults.set_excluded(int(cmd_args[1]), cmd_args[0] == 'exclude'):
+                    log.info(f'Round {cmd_args[1]} will be {cmd_args[0]}d when rescoring')
+                else:
+                    log.error(f'No results stored for round {cmd_args[1]}!')
+            case 'rescore':
+                if isinstance(self.engine, RvBScoringEngine):
+                    if not self.engine.engine_lock:
+                        log.info('Rescoring all rounds')
+                        self.engine.rescore()
+                    else:
+                        log.warning('Cannot rescore while running!')
+                else:
+                    log.error('Engine does not exist!')
+            case 'export':
+                if isinstance(self.engine, RvBScoringEngine):
+                    if not self.engine.engine_lock:
+                        format = cmd_args[1] if len(cmd_args) > 1 else export_settings['format']
+                        if format not in ScoreExporter.formats:
+                            log.error(f'Export format must be one of {", ".join(ScoreExporter.formats)}')
+                            return
+                        self.engine.export(format)
+                    else:
+                        log.warning('Cannot export while running!')
+                else:
+                    log.error('Engine does not exist!')
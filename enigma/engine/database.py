@@ -1,11 +1,80 @@
-from sqlmodel import create_engine, SQLModel, Session
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlmodel import create_engine, SQLModel, Session, text
 
-from enigma.engine import postgres_settings
+from enigma.logger import log
+from enigma.engine import database_url
 
-db_engine = create_engine(
-    f'postgresql+psycopg://{postgres_settings['user']}:{postgres_settings['password']}@{postgres_settings['host']}:{postgres_settings['port']}/enigma',
-    echo=False
-)
+# Pragmas set on every SQLite connection
+# WAL lets the web apps read while the engine writes, and with WAL a NORMAL sync still cannot corrupt the database
+# busy_timeout makes a writer wait on a lock held by another process instead of failing straight away
+# SQLite does not enforce foreign keys unless asked, PostgreSQL always does
+sqlite_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 30000,
+    'foreign_keys': 'ON',
+    'temp_store': 'MEMORY',
+    'cache_size': -65536
+}
+
+# Creates the DB engine for a database URL
+# SQLite connections are shared by the engine's threads, and an in-memory database is kept on one connection
+# so every thread sees the same data, with the threads taking turns on it
+def create_db_engine(url: str):
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(url, echo=False)
+
+    options = {
+        'connect_args': {'check_same_thread': False}
+    }
+    # An in-memory database lives and dies with its connection, so it is kept on a pool of exactly one
+    # A thread waits for the connection to be returned before it gets it, so one thread's commit or rollback
+    # never lands in another thread's transaction
+    if url.database in (None, '', ':memory:'):
+        options['poolclass'] = QueuePool
+        options['pool_size'] = 1
+        options['max_overflow'] = 0
+    engine = create_engine(url, echo=False, **options)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in sqlite_pragmas.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        cursor.close()
+
+    return engine
+
+db_engine = create_db_engine(database_url)
+
+# Columns added to existing tables since the first release, with the value given to rows that predate them
+# create_all() only creates missing tables, so init_db() adds these to a database made by an older release
+added_columns = {
+    ('injectreports', 'updated'): 'CURRENT_TIMESTAMP',
+    ('settings', 'check_spread'): '0',
+    ('settings', 'fixed_cadence'): 'FALSE'
+}
+
+# Adds any missing columns to an existing database in place
+# The columns are added without defaults, since SQLite cannot add a column with a non-constant default
+# Defaults for new rows still come from the models, and from the triggers for injectreports.updated
+def migrate_db():
+    inspector = inspect(db_engine)
+    with Session(db_engine) as session:
+        for (table_name, column_name), value in added_columns.items():
+            if column_name in [column['name'] for column in inspector.get_columns(table_name)]:
+                continue
+            log.info(f'Adding column {column_name} to table {table_name}')
+            column = SQLModel.metadata.tables[table_name].columns[column_name]
+            column_type = column.type.compile(dialect=db_engine.dialect)
+            session.exec(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+            session.exec(text(f'UPDATE {table_name} SET {column_name} = {value}'))
+            if column.index:
+                session.exec(text(f'CREATE INDEX ix_{table_name}_{column_name} ON {table_name} ({column_name})'))
+        session.commit()
 
 def init_db():
     from db_models import (
@@ -16,11 +85,93 @@ def init_db():
         InjectReportDB,
         ScoreReportDB,
         SLAReportDB,
+        RoundResultsDB,
+        ScoreIndexDB,
         RvBTeamDB,
         ParableUserDB,
-        SettingsDB
+        SettingsDB,
+        ConfigVersionDB
     )
     SQLModel.metadata.create_all(db_engine)
+    migrate_db()
+
+    # Signalling every change to the settings table so running processes can reload their settings
+    if db_engine.dialect.name == 'postgresql':
+        with Session(db_engine) as session:
+            session.exec(text('''
+                CREATE OR REPLACE FUNCTION notify_settings() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('enigma_settings', '');
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            '''))
+            session.exec(text('''
+                CREATE OR REPLACE TRIGGER settings_notify
+                AFTER INSERT OR UPDATE OR DELETE ON settings
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_settings()
+            '''))
+            session.commit()
+
+    # Bumping the box config version on every change to the boxes table, whoever makes it
+    with Session(db_engine) as session:
+        if session.get(ConfigVersionDB, 'boxes') is None:
+            session.add(ConfigVersionDB(name='boxes'))
+        if db_engine.dialect.name == 'postgresql':
+            session.exec(text('''
+                CREATE OR REPLACE FUNCTION bump_box_version() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE configversions SET version = version + 1 WHERE name = 'boxes';
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            '''))
+            session.exec(text('''
+                CREATE OR REPLACE TRIGGER boxes_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON boxes
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_box_version()
+            '''))
+        elif db_engine.dialect.name == 'sqlite':
+            for change in ('INSERT', 'UPDATE', 'DELETE'):
+                session.exec(text(f'''
+                    CREATE TRIGGER IF NOT EXISTS boxes_version_{change.lower()}
+                    AFTER {change} ON boxes
+                    BEGIN
+                        UPDATE configversions SET version = version + 1 WHERE name = 'boxes';
+                    END
+                '''))
+        session.commit()
+
+    # Stamping every inject report with the time it was graded, whoever writes it
+    # The engine picks up changed grades by this time, so it must not depend on the writer setting it
+    with Session(db_engine) as session:
+        if db_engine.dialect.name == 'postgresql':
+            session.exec(text('''
+                CREATE OR REPLACE FUNCTION stamp_inject_report() RETURNS trigger AS $$
+                BEGIN
+                    NEW.updated := now();
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            '''))
+            session.exec(text('''
+                CREATE OR REPLACE TRIGGER injectreports_updated
+                BEFORE INSERT OR UPDATE ON injectreports
+                FOR EACH ROW EXECUTE FUNCTION stamp_inject_report()
+            '''))
+        elif db_engine.dialect.name == 'sqlite':
+            # SQLite triggers cannot change NEW, so the row is stamped again after the change
+            # The trigger's own update does not fire it again, as recursive triggers are off
+            for change in ('INSERT', 'UPDATE'):
+                session.exec(text(f'''
+                    CREATE TRIGGER IF NOT EXISTS injectreports_updated_{change.lower()}
+                    AFTER {change} ON injectreports
+                    BEGIN
+                        UPDATE injectreports SET updated = CURRENT_TIMESTAMP
+                        WHERE team_id = NEW.team_id AND inject_num = NEW.inject_num;
+                    END
+                '''))
+        session.commit()
 
 def del_db():
     from db_models import (
@@ -31,8 +182,11 @@ def del_db():
         InjectReportDB,
         ScoreReportDB,
         SLAReportDB,
+        RoundResultsDB,
+        ScoreIndexDB,
         RvBTeamDB,
         ParableUserDB,
-        SettingsDB
+        SettingsDB,
+        ConfigVersionDB
     )
     SQLModel.metadata.drop_all(db_engine)
\ No newline at end of file
@@ -0,0 +1,33 @@
+from enigma.logger import log
+
+from enigma.models.box import Box
+
+# Competition environment cache
+# Holds the compiled boxes and service names, keyed by the version of the box config they were built from
+# Boxes and their services are only rebuilt when the box config in the DB actually changes
+class Environment:
+
+    def __init__(self):
+        self.version = None
+        self.boxes = []
+        self.services = []
+
+    def __repr__(self):
+        return '<{}> version {} with {} boxes and {} services'.format(
+            type(self).__name__,
+            self.version,
+            len(self.boxes),
+            len(self.services)
+        )
+
+    # Brings the environment up to date with the DB
+    # Returns True if the box config changed
+    def refresh(self) -> bool:
+        version, boxes = Box.find_all_if_changed(self.version)
+        if boxes is None:
+            return False
+        self.boxes = boxes
+        self.services = Box.all_service_names(self.boxes)
+        self.version = version
+        log.info(f'Loaded box config version {self.version}')
+        return True
@@ -0,0 +1,255 @@
+import csv
+import json
+import os
+from itertools import groupby
+from os.path import join, exists
+
+import numpy as np
+from sqlmodel import Session
+
+from enigma.logger import log
+from enigma.engine.database import db_engine
+from enigma.engine.scoreboard import ScoreBoard
+from enigma.models.roundresults import RoundResults
+from enigma.models.scoreindex import ScoreIndex
+
+# Columns of the per-round history
+# points and penalty_points are the team's running totals for the service as of the round
+history_fields = [
+    'round',
+    'team_id',
+    'service',
+    'passed',
+    'sla_violation',
+    'points',
+    'penalty_points'
+]
+
+# Columns of the per-team score breakdowns
+breakdown_fields = [
+    'team_id',
+    'point_category',
+    'raw_points',
+    'penalty_points',
+    'total_points'
+]
+
+# Score exporter
+# Streams the per-round score history to disk as rounds are tabulated, and keeps the per-team breakdowns up to date
+# format is one of
+# csv       history.csv and breakdowns.csv
+# jsonl     history.jsonl and breakdowns.jsonl, one JSON object per row
+# npz       compressed columnar files, history is written in chunks of chunk_rounds rounds
+# History is only ever appended to, so each round costs the same no matter how long the competition runs
+class ScoreExporter:
+
+    formats = ('csv', 'jsonl', 'npz')
+
+    def __init__(self, path: str, format: str, chunk_rounds: int = 100):
+        if format not in self.formats:
+            raise ValueError(f'Unknown export format {format}')
+        self.path = path
+        self.format = format
+        self.chunk_rounds = chunk_rounds
+        self.history = None
+        self.writer = None
+        self.chunk = []
+
+    def __repr__(self):
+        return '<{}> writing {} to {}'.format(type(self).__name__, self.format, self.path)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Opens the history for appending, so a resumed engine carries on where it left off
+    # With append set to False any existing history is thrown away
+    def open(self, append: bool = True):
+        os.makedirs(self.path, exist_ok=True)
+        match self.format:
+            case 'csv':
+                filepath = join(self.path, 'history.csv')
+                new_file = not append or not exists(filepath)
+                self.history = open(filepath, 'a' if append else 'w', newline='')
+                self.writer = csv.writer(self.history)
+                if new_file:
+                    self.writer.writerow(history_fields)
+            case 'jsonl':
+                self.history = open(join(self.path, 'history.jsonl'), 'a' if append else 'w')
+            case 'npz':
+                if not append:
+                    for filename in os.listdir(self.path):
+                        if filename.startswith('history-') and filename.endswith('.npz'):
+                            os.remove(join(self.path, filename))
+        log.debug(f'Opened {self.format} score export in {self.path}')
+
+    # Writes any buffered history and closes the history file
+    def close(self):
+        self.write_chunk()
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+            self.writer = None
+        log.debug(f'Closed {self.format} score export in {self.path}')
+
+    #######################
+    # History methods
+
+    # Appends a round to the history
+    # results and violations have a row per team in team_ids and a column per service in services
+    # points and penalties are the running totals for the same teams and services
+    def write_round(self, round: int, team_ids: list[int], services: list[str], results: np.ndarray,
+                    violations: np.ndarray, points: np.ndarray, penalties: np.ndarray):
+        match self.format:
+            case 'csv':
+                for team_id, team_results, team_violations, team_points, team_penalties in zip(
+                    team_ids, results.tolist(), violations.tolist(), points.tolist(), penalties.tolist()
+                ):
+                    self.writer.writerows(
+                        zip(
+                            [round] * len(services),
+                            [team_id] * len(services),
+                            services,
+                            map(int, team_results),
+                            map(int, team_violations),
+                            team_points,
+                            team_penalties
+                        )
+                    )
+                self.history.flush()
+            case 'jsonl':
+                for team_id, team_results, team_violations, team_points, team_penalties in zip(
+                    team_ids, results.tolist(), violations.tolist(), points.tolist(), penalties.tolist()
+                ):
+                    for row in zip([round] * len(services), [team_id] * len(services), services,
+                                   team_results, team_violations, team_points, team_penalties):
+                        self.history.write(json.dumps(dict(zip(history_fields, row))) + '\n')
+                self.history.flush()
+            case 'npz':
+                self.chunk.append((round, list(team_ids), list(services), results, violations, points, penalties))
+                if len(self.chunk) >= self.chunk_rounds:
+                    self.write_chunk()
+
+    # Writes the buffered rounds as one compressed columnar history file
+    # Services are stored once in a 'services' column and referenced by index
+    def write_chunk(self):
+        if not self.chunk:
+            return
+        services = []
+        service_index = {}
+        columns = {field: [] for field in history_fields}
+        for round, team_ids, round_services, results, violations, points, penalties in self.chunk:
+            for service in round_services:
+                if service not in service_index:
+                    service_index[service] = len(services)
+                    services.append(service)
+            rows, cols = np.indices(results.shape)
+            columns['round'].append(np.full(results.size, round, dtype=np.int64))
+            columns['team_id'].append(np.array(team_ids, dtype=np.int64)[rows.ravel()])
+            columns['service'].append(np.array([service_index[service] for service in round_services], dtype=np.int32)[cols.ravel()])
+            columns['passed'].append(results.ravel())
+            columns['sla_violation'].append(violations.ravel())
+            columns['points'].append(points.ravel())
+            columns['penalty_points'].append(penalties.ravel())
+        filepath = join(self.path, f'history-{self.chunk[0][0]:06d}-{self.chunk[-1][0]:06d}.npz')
+        write_npz(
+            filepath,
+            services=np.array(services, dtype=np.str_),
+            **{field: np.concatenate(values) for field, values in columns.items()}
+        )
+        log.debug(f'Wrote score history chunk {filepath}')
+        self.chunk = []
+
+    #######################
+    # Breakdown methods
+
+    # Rewrites the per-team breakdowns from the scoreboard
+    # Penalties line up with points by scoreboard column, so no matching by name is needed
+    def write_breakdowns(self, scoreboard: ScoreBoard):
+        filepath = join(self.path, f'breakdowns.{self.format}')
+        if self.format == 'npz':
+            write_npz(filepath, **scoreboard.get_state())
+            return
+
+        temp_path = f'{filepath}.tmp'
+        with open(temp_path, 'w', newline='') as f:
+            if self.format == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(breakdown_fields)
+                for row in iter_breakdowns(scoreboard):
+                    writer.writerow(row)
+            else:
+                for row in iter_breakdowns(scoreboard):
+                    f.write(json.dumps(dict(zip(breakdown_fields, row))) + '\n')
+        os.replace(temp_path, filepath)
+
+# Rewrites the whole history from the DB, for example after a rescore
+# The stored round results and the score index are both streamed in round order and merged one round at a time,
+# on one session so an in-memory database's single connection is enough
+# SLA violations are the rounds where a service's running penalty went up
+def export_history(exporter: ScoreExporter):
+    log.info(f'Exporting score history to {exporter.path}')
+    exporter.open(append=False)
+    with Session(db_engine) as session:
+        index = groupby(ScoreIndex.stream(session=session), key=lambda entry: entry.round)
+        index_round, entries = next(index, (None, None))
+        last_penalties = {}
+        for round_results in RoundResults.stream(session=session):
+            while index_round is not None and index_round < round_results.round:
+                index_round, entries = next(index, (None, None))
+            if round_results.excluded or index_round != round_results.round:
+                continue
+
+            entries = {entry.team_id: entry for entry in entries}
+            rows = [i for i, team_id in enumerate(round_results.team_ids) if team_id in entries]
+            team_ids = [round_results.team_ids[i] for i in rows]
+            services = round_results.services
+            points = np.array(
+                [[entries[team_id].services.get(service, [0, 0])[0] for service in services] for team_id in team_ids],
+                dtype=np.int64
+            ).reshape(len(team_ids), len(services))
+            penalties = np.array(
+                [[entries[team_id].services.get(service, [0, 0])[1] for service in services] for team_id in team_ids],
+                dtype=np.int64
+            ).reshape(len(team_ids), len(services))
+            previous = np.array(
+                [[last_penalties.get((team_id, service), 0) for service in services] for team_id in team_ids],
+                dtype=np.int64
+            ).reshape(len(team_ids), len(services))
+            for team_id, team_penalties in zip(team_ids, penalties.tolist()):
+                last_penalties.update(zip([(team_id, service) for service in services], team_penalties))
+
+            exporter.write_round(
+                round_results.round,
+                team_ids,
+                services,
+                round_results.results[rows],
+                penalties > previous,
+                points,
+                penalties
+            )
+    exporter.close()
+
+# Yields a breakdown row for every team's total, services and injects
+def iter_breakdowns(scoreboard: ScoreBoard):
+    raw_scores = scoreboard.raw_scores().tolist()
+    penalty_scores = scoreboard.penalty_scores().tolist()
+    points = scoreboard.points.tolist()
+    penalties = scoreboard.penalties.tolist()
+    inject_points = scoreboard.inject_points.tolist()
+    for i, team_id in enumerate(scoreboard.team_ids):
+        yield team_id, 'total', raw_scores[i], penalty_scores[i], raw_scores[i] - penalty_scores[i]
+        for service, service_points, service_penalty in zip(scoreboard.services, points[i], penalties[i]):
+            yield team_id, service, service_points, service_penalty, service_points - service_penalty
+        for inject_num, inject_score in zip(scoreboard.injects, inject_points[i]):
+            yield team_id, f'inject{inject_num}', inject_score, 0, inject_score
+
+# Writes a compressed .npz file, swapping it in once it is complete
+def write_npz(filepath: str, **arrays):
+    temp_path = f'{filepath}.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temp_path, filepath)
@@ -0,0 +1,60 @@
+import queue
+import threading
+
+from enigma.logger import log
+
+# Background stage for the scoring pipeline
+# Work for each round is run on a single thread, in the order the rounds were submitted,
+# so the next round's checks can be dispatched while this round is still being written
+# The queue is bounded so a stage that falls far behind holds up dispatch instead of piling up rounds
+# Rounds build on each other, so once a round fails every later round is dropped and on_error is called with the
+# failed round, letting the owner stop and recover instead of carrying on with a gap
+class PipelineStage:
+
+    def __init__(self, name: str, target, max_pending: int = 2, on_error=None):
+        self.name = name
+        self.target = target
+        self.on_error = on_error
+        self.rounds = queue.Queue(maxsize=max_pending)
+        self.thread = None
+        self.failed_round = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        log.debug(f'Starting {self.name} stage')
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Queues a round for the stage, blocking if the stage is too far behind
+    def submit(self, round: int, *args):
+        self.rounds.put((round, args))
+
+    def run(self):
+        while True:
+            item = self.rounds.get()
+            # None is the signal to shut down
+            if item is None:
+                break
+            round, args = item
+            if self.failed_round is not None:
+                log.warning(f'{self.name} dropping round {round}, round {self.failed_round} failed')
+                continue
+            try:
+                self.target(round, *args)
+            except Exception:
+                log.exception(f'{self.name} failed for round {round}')
+                self.failed_round = round
+                if self.on_error is not None:
+                    self.on_error(round)
+
+    # Waits for every queued round to finish, then stops the stage
+    def close(self):
+        self.rounds.put(None)
+        self.thread.join()
+        log.debug(f'Stopped {self.name} stage')
@@ -0,0 +1,126 @@
+import sys
+import json
+
+from enigma.checks import Service
+from enigma.logger import log
+
+from enigma.models.box import Box
+from enigma.models.team import RvBTeam
+
+# Finds the check options for a service that do not change from round to round
+def get_static_check_options(service: Service) -> list[str]:
+    check_options = []
+
+    # If check has a port, add to options
+    if hasattr(service, 'port'):
+        check_options.extend([
+            '--port',
+            str(service.port)
+        ])
+
+    # If check has auth methods, add to options
+    if hasattr(service, 'auth'):
+        check_options.extend([
+            '--auth',
+            str(service.auth)
+        ])
+
+    # If check has key file, add path to options
+    if hasattr(service, 'keyfile'):
+        check_options.extend([
+            '--keyfile',
+            str(service.keyfile)
+        ])
+
+    # If check has a specific path to check, add path to options
+    if hasattr(service, 'path'):
+        check_options.extend([
+            '--path',
+            str(service.path)
+        ])
+
+    # If check is modelled, such as a synthetic check, add the model to options
+    if hasattr(service, 'model'):
+        check_options.extend([
+            '--model',
+            json.dumps(service.model, separators=(',', ':'))
+        ])
+
+    return check_options
+
+# A single score check in the check plan
+# key is (team identifier, 'box.service'), check_data holds everything but the dynamic options
+# credlists is the list of credlist names to pick a cred from each round, or None if the check takes no creds
+# needs_round is set if the service needs the round number, such as a seeded synthetic check
+class PlannedCheck:
+
+    __slots__ = ('key', 'team', 'check_data', 'credlists', 'needs_round')
+
+    def __init__(self, key: tuple[int, str], team: RvBTeam, check_data: list[str], credlists: list[str] | None,
+                 needs_round: bool = False):
+        self.key = key
+        self.team = team
+        self.check_data = check_data
+        self.credlists = credlists
+        self.needs_round = needs_round
+
+    # Creates this round's check data
+    def render(self, round: int) -> list[str]:
+        if self.credlists is None and not self.needs_round:
+            return self.check_data
+        check_data = list(self.check_data)
+        if self.credlists is not None:
+            check_data.extend([
+                '--creds',
+                str(self.team.get_random_cred(self.credlists))
+            ])
+        if self.needs_round:
+            check_data.extend([
+                '--round',
+                str(round)
+            ])
+        return check_data
+
+# Check plan
+# Every score check for every team, box and service, compiled once per environment
+# Addresses, service identities and static options are worked out when the plan is built,
+# so each round only fills in the dynamic options such as a random cred or the round number
+class CheckPlan:
+
+    def __init__(self, boxes: list[Box], teams: list[RvBTeam], first_octets: str):
+        self.checks = []
+        for box in boxes:
+            for service in box.services:
+                full_service_name = sys.intern(f'{box.name}.{service.name}')
+                static_options = get_static_check_options(service)
+                credlists = service.credlist if hasattr(service, 'credlist') else None
+                for team in teams:
+                    self.checks.append(
+                        PlannedCheck(
+                            key=(team.identifier, full_service_name),
+                            team=team,
+                            check_data=[
+                                full_service_name,
+                                f'{first_octets}.{team.identifier}.{box.identifier}'
+                            ] + static_options,
+                            credlists=credlists,
+                            needs_round=service.needs_round
+                        )
+                    )
+        log.debug(f'Compiled check plan with {len(self.checks)} checks')
+
+    def __repr__(self):
+        return '<{}> with {} checks'.format(type(self).__name__, len(self.checks))
+
+    def __len__(self):
+        return len(self.checks)
+
+    # Creates this round's score checks as [(key, check data)]
+    def render(self, round: int) -> list[tuple[tuple[int, str], list[str]]]:
+        return [(check.key, check.render(round)) for check in self.checks]
+
+    # Identifies what a check plan was built from
+    # A plan only needs to be rebuilt when this changes
+    @classmethod
+    def plan_key(cls, environment_version: str, teams: list[RvBTeam], first_octets: str) -> tuple:
+        return (environment_version, tuple(team.identifier for team in teams), first_octets)
@@ -0,0 +1,205 @@
+import json
+from bisect import bisect_right
+
+import numpy as np
+from sqlmodel import Session, delete, insert, update, case
+
+from enigma.logger import log
+from enigma.engine.database import db_engine
+from enigma.models.roundresults import RoundResults
+from enigma.models.scoreindex import ScoreIndex
+
+from db_models import ScoreReportDB, SLAReportDB, ScoreIndexDB, RvBTeamDB
+
+# Number of rows written at once while rescoring
+write_batch_size = 5000
+
+# Rescore
+# Recomputes service points, SLA streaks and SLA penalties for every team from the stored round results
+# Rounds are streamed from the DB and replayed one at a time with the same vectorized step as the scoreboard,
+# so only the teams x services state and one batch of rows are held in memory, however long the competition ran
+# Excluded rounds score nothing, as if they were never run, but keep index entries and score reports
+# that carry the totals of the round before them
+# Inject points are taken from the old score index, so every round keeps the inject points it had at the time
+class Rescore:
+
+    def __init__(self, team_ids: list[int], check_points: int, sla_penalty: int, sla_requirement: int):
+        self.team_ids = list(team_ids)
+        self.team_index = {team_id: i for i, team_id in enumerate(self.team_ids)}
+        self.check_points = check_points
+        self.sla_penalty = sla_penalty
+        self.sla_requirement = sla_requirement
+
+        self.services = []
+        self.service_index = {}
+        self.round_count = 0
+        self.violation_count = 0
+        self.last_round = 0
+
+        # Totals after the last replayed round, with a row per team and a column per service
+        self.points = np.zeros((len(self.team_ids), 0), dtype=np.int64)
+        self.penalties = np.zeros((len(self.team_ids), 0), dtype=np.int64)
+        self.sla_tracker = np.zeros((len(self.team_ids), 0), dtype=np.int64)
+
+        # Rounds where each team's inject points changed and its inject points from that round on
+        self.inject_history = {team_id: ([], []) for team_id in self.team_ids}
+
+        # Rows waiting to be written
+        self.sla_reports = []
+        self.score_reports = []
+        self.score_index = []
+
+    def __repr__(self):
+        return '<{}> of {} rounds for {} teams and {} services'.format(
+            type(self).__name__,
+            self.round_count,
+            len(self.team_ids),
+            len(self.services)
+        )
+
+    # Adds a column for every service not seen in an earlier round
+    def add_services(self, services: list[str]):
+        new_services = [service for service in services if service not in self.service_index]
+        if not new_services:
+            return
+        for service in new_services:
+            self.service_index[service] = len(self.services)
+            self.services.append(service)
+        padding = ((0, 0), (0, len(new_services)))
+        self.points = np.pad(self.points, padding)
+        self.penalties = np.pad(self.penalties, padding)
+        self.sla_tracker = np.pad(self.sla_tracker, padding)
+
+    # Gets which of a round's teams are still in the competition and their rows
+    def get_rows(self, round_results: RoundResults) -> tuple[np.ndarray, np.ndarray]:
+        team_rows = [self.team_index.get(team_id) for team_id in round_results.team_ids]
+        kept = np.array([row is not None for row in team_rows], dtype=bool)
+        rows = np.array([row for row in team_rows if row is not None], dtype=np.intp)
+        return kept, rows
+
+    # Replays one round and returns the rows of the teams scored in it and its SLA violations
+    # Services a team was not checked for in the round leave its SLA streak alone
+    def apply_round(self, round_results: RoundResults) -> tuple[np.ndarray, np.ndarray]:
+        self.add_services(round_results.services)
+        kept, rows = self.get_rows(round_results)
+        columns = np.array([self.service_index[service] for service in round_results.services], dtype=np.intp)
+
+        checked = np.zeros(self.points.shape, dtype=bool)
+        passed = np.zeros(self.points.shape, dtype=bool)
+        checked[np.ix_(rows, columns)] = True
+        passed[np.ix_(rows, columns)] = round_results.results[kept].reshape(len(rows), len(columns))
+        failed = checked & ~passed
+
+        tracker = np.where(passed, 0, self.sla_tracker + failed)
+        violations = tracker >= self.sla_requirement
+        tracker[violations] = 0
+        self.sla_tracker = tracker
+        self.points += passed * self.check_points
+        self.penalties += violations * self.sla_penalty
+        return rows, violations
+
+    # Replays every stored round and rewrites the SLA reports, the score in every score report,
+    # the score index and the team totals in one transaction
+    # inject_scores is each team's current inject total, which is added to the team totals
+    def run(self, inject_scores: np.ndarray):
+        log.info('Rescoring from stored round results')
+        with Session(db_engine) as session:
+            self.load_inject_history(session)
+            session.exec(delete(SLAReportDB))
+            session.exec(delete(ScoreIndexDB))
+            for round_results in RoundResults.stream(session=session):
+                self.last_round = round_results.round
+                if round_results.excluded:
+                    log.debug(f'Scoring nothing for excluded round {round_results.round}')
+                    _, rows = self.get_rows(round_results)
+                    violations = np.zeros(self.points.shape, dtype=bool)
+                else:
+                    rows, violations = self.apply_round(round_results)
+                    self.round_count = self.round_count + 1
+                self.add_round_rows(round_results.round, rows, violations)
+                if len(self.sla_reports) + len(self.score_reports) + len(self.score_index) >= write_batch_size:
+                    self.write_rows(session)
+            self.write_rows(session)
+
+            if not self.round_count:
+                log.warning('No round results to rescore from!')
+            if self.team_ids:
+                totals = self.points.sum(axis=1) - self.penalties.sum(axis=1) + np.array(inject_scores, dtype=np.int64)
+                session.exec(
+                    update(
+                        RvBTeamDB
+                    ).where(
+                        RvBTeamDB.identifier.in_(self.team_ids)
+                    ).values(
+                        score=case(dict(zip(self.team_ids, totals.tolist())), value=RvBTeamDB.identifier)
+                    )
+                )
+            session.commit()
+        log.info(f'Rescored {self.round_count} rounds with {self.violation_count} SLA violations')
+
+    # Gets a team's inject points as of the end of a round
+    def get_inject_score(self, team_id: int, round: int) -> int:
+        rounds, scores = self.inject_history[team_id]
+        i = bisect_right(rounds, round)
+        return scores[i - 1] if i else 0
+
+    # Queues a replayed round's SLA reports, score report scores and score index entries
+    def add_round_rows(self, round: int, rows: np.ndarray, violations: np.ndarray):
+        for t, s in np.argwhere(violations).tolist():
+            self.sla_reports.append({
+                'team_id': self.team_ids[t],
+                'round': round,
+                'service': self.services[s]
+            })
+        self.violation_count = self.violation_count + int(violations.sum())
+
+        raw_scores = self.points.sum(axis=1).tolist()
+        penalty_scores = self.penalties.sum(axis=1).tolist()
+        for t in rows.tolist():
+            raw_score = raw_scores[t] + self.get_inject_score(self.team_ids[t], round)
+            total_score = raw_score - penalty_scores[t]
+            self.score_reports.append({
+                'team_id': self.team_ids[t],
+                'round': round,
+                'score': total_score
+            })
+            self.score_index.append({
+                'round': round,
+                'team_id': self.team_ids[t],
+                'total_score': total_score,
+                'raw_score': raw_score,
+                'penalty_score': penalty_scores[t],
+                'services': json.dumps({
+                    service: [service_points, service_penalty]
+                    for service, service_points, service_penalty in zip(
+                        self.services, self.points[t].tolist(), self.penalties[t].tolist()
+                    )
+                })
+            })
+
+    #######################
+    # DB fetch/add
+
+    # Reads each team's inject points as of every round from the score index before it is rewritten
+    # The inject points are the part of the raw score not earned by services, and only the rounds they change in are kept
+    def load_inject_history(self, session: Session):
+        for entry in ScoreIndex.stream(session=session):
+            if entry.team_id not in self.inject_history:
+                continue
+            rounds, scores = self.inject_history[entry.team_id]
+            inject_score = entry.raw_score - sum(points for points, _ in entry.services.values())
+            if inject_score != (scores[-1] if scores else 0):
+                rounds.append(entry.round)
+                scores.append(inject_score)
+
+    # Writes the queued rows
+    def write_rows(self, session: Session):
+        if self.sla_reports:
+            session.exec(insert(SLAReportDB), params=self.sla_reports)
+        if self.score_reports:
+            session.exec(update(ScoreReportDB), params=self.score_reports)
+        if self.score_index:
+            session.exec(insert(ScoreIndexDB), params=self.score_index)
+        self.sla_reports = []
+        self.score_reports = []
+        self.score_index = []
@@ -0,0 +1,84 @@
+import random
+import sched
+import threading
+import time
+
+from enigma.logger import log
+
+# Checks whose start times fall in the same tick are handed to the executor together
+stagger_tick = 0.1
+
+# Spreads check start times across the spread window
+# Each service gets its own slot in the window, and each of its checks starts at its own random point within that slot,
+# so one service's checks for every team do not hit at the same instant
+# Start times are rounded down to the tick, so checks are still dispatched in batches
+# checks = [(key, check data)]
+# Returns [(offset in seconds, [(key, check data)])] in start time order
+def stagger_checks(checks: list[tuple], spread: int) -> list[tuple[float, list]]:
+    if spread <= 0:
+        return [(0, checks)]
+
+    groups = {}
+    for key, check_data in checks:
+        groups.setdefault(check_data[0], []).append((key, check_data))
+
+    slot = spread / len(groups)
+    ticks = {}
+    for i, service in enumerate(sorted(groups.keys())):
+        for check in groups[service]:
+            tick = int((i * slot + random.uniform(0, slot)) / stagger_tick)
+            ticks.setdefault(tick, []).append(check)
+    return [(tick * stagger_tick, ticks[tick]) for tick in sorted(ticks.keys())]
+
+# In-round check scheduler
+# Hands groups of checks to a check executor at their own start times instead of all at once
+# Keeps track of the task ID the executor assigned to each check so late checks can be cancelled
+class CheckScheduler:
+
+    def __init__(self, executor, check_timeout: int, round: int):
+        self.executor = executor
+        self.check_timeout = check_timeout
+        self.round = round
+        self.scheduler = sched.scheduler(time.monotonic, time.sleep)
+        self.task_ids = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        # Time spent handing checks to the executor
+        self.dispatch_time = 0.0
+
+    # Schedules each group of checks at its offset from now and starts dispatching
+    def start(self, check_groups: list[tuple[float, list]]):
+        start_time = time.monotonic()
+        for offset, checks in check_groups:
+            self.scheduler.enterabs(start_time + offset, 1, self.submit, (checks,))
+        log.debug(f'Scheduled {len(check_groups)} groups of score checks')
+        self.thread = threading.Thread(target=self.scheduler.run, daemon=True)
+        self.thread.start()
+
+    # Hands a group of checks to the executor
+    def submit(self, checks: list[tuple]):
+        start = time.perf_counter()
+        task_ids = self.executor.submit(
+            [check_data for key, check_data in checks],
+            self.check_timeout,
+            self.round
+        )
+        self.dispatch_time = self.dispatch_time + time.perf_counter() - start
+        with self.lock:
+            for (key, check_data), task_id in zip(checks, task_ids):
+                self.task_ids[key] = task_id
+
+    # Drops any checks that have not been dispatched yet and waits for dispatching to finish
+    def stop(self):
+        for event in self.scheduler.queue:
+            try:
+                self.scheduler.cancel(event)
+            except ValueError:
+                pass
+        if self.thread:
+            self.thread.join()
+
+    # Gets the task IDs of dispatched checks
+    def get_task_ids(self, keys) -> list[int]:
+        with self.lock:
+            return [self.task_ids[key] for key in keys if key in self.task_ids]
@@ -0,0 +1,164 @@
+import numpy as np
+
+from enigma.logger import log
+
+# Scoreboard
+# Holds the scoring state for every team as NumPy arrays, with a row per team and a column per service
+# points        service check points
+# penalties     SLA penalty points
+# sla_tracker   current streak of failed checks
+# injects       inject points, with a column per inject
+# Rounds are applied to every team and service at once from a boolean results matrix
+class ScoreBoard:
+
+    def __init__(self, team_ids: list[int], services: list[str]):
+        self.team_ids = list(team_ids)
+        self.team_index = {team_id: i for i, team_id in enumerate(self.team_ids)}
+        self.services = []
+        self.service_index = {}
+        self.injects = []
+        self.inject_index = {}
+
+        self.points = np.zeros((len(self.team_ids), 0), dtype=np.int64)
+        self.penalties = np.zeros((len(self.team_ids), 0), dtype=np.int64)
+        self.sla_tracker = np.zeros((len(self.team_ids), 0), dtype=np.int64)
+        self.inject_points = np.zeros((len(self.team_ids), 0), dtype=np.int64)
+
+        self.add_services(services)
+        log.debug(f'Created ScoreBoard for {len(self.team_ids)} teams and {len(self.services)} services')
+
+    def __repr__(self):
+        return '<{}> with {} teams and {} services'.format(
+            type(self).__name__,
+            len(self.team_ids),
+            len(self.services)
+        )
+
+    # Adds columns for any services not already on the scoreboard
+    def add_services(self, services: list[str]):
+        new_services = [service for service in services if service not in self.service_index]
+        if not new_services:
+            return
+        for service in new_services:
+            self.service_index[service] = len(self.services)
+            self.services.append(service)
+        padding = ((0, 0), (0, len(new_services)))
+        self.points = np.pad(self.points, padding)
+        self.penalties = np.pad(self.penalties, padding)
+        self.sla_tracker = np.pad(self.sla_tracker, padding)
+
+    # Gets the scoreboard columns for a list of services, adding any that are missing
+    def get_columns(self, services: list[str]) -> np.ndarray:
+        self.add_services(services)
+        return np.array([self.service_index[service] for service in services], dtype=np.intp)
+
+    #######################
+    # Scoring methods
+
+    # Applies a round of check results to every team at once
+    # results is a boolean matrix with a row per team and a column per service in services
+    # Services that were not checked this round are left alone
+    # Passing checks are awarded points and reset the SLA tracker, failing checks extend it,
+    # and a streak reaching sla_requirement is an SLA violation, which is penalized and resets the tracker
+    # Returns the SLA violations as a boolean matrix shaped like results
+    def apply_round(self, services: list[str], results: np.ndarray, check_points: int, sla_penalty: int, sla_requirement: int) -> np.ndarray:
+        columns = self.get_columns(services)
+
+        self.points[:, columns] += results * check_points
+
+        tracker = np.where(results, 0, self.sla_tracker[:, columns] + 1)
+        violations = tracker >= sla_requirement
+        tracker[violations] = 0
+        self.sla_tracker[:, columns] = tracker
+        self.penalties[:, columns] += violations * sla_penalty
+
+        return violations
+
+    # Sets a team's points for an inject
+    # Returns True if the points changed
+    def set_inject_points(self, team_id: int, inject_num: int, points: int) -> bool:
+        if inject_num not in self.inject_index:
+            self.inject_index[inject_num] = len(self.injects)
+            self.injects.append(inject_num)
+            self.inject_points = np.pad(self.inject_points, ((0, 0), (0, 1)))
+        row = self.team_index[team_id]
+        column = self.inject_index[inject_num]
+        if self.inject_points[row, column] == points:
+            return False
+        self.inject_points[row, column] = points
+        return True
+
+    #######################
+    # Checkpoint methods
+
+    # Gets the full scoreboard state as plain arrays
+    def get_state(self) -> dict[str: np.ndarray]:
+        return {
+            'team_ids': np.array(self.team_ids, dtype=np.int64),
+            'services': np.array(self.services, dtype=np.str_),
+            'injects': np.array(self.injects, dtype=np.int64),
+            'points': self.points,
+            'penalties': self.penalties,
+            'sla_tracker': self.sla_tracker,
+            'inject_points': self.inject_points
+        }
+
+    # Loads scoreboard state saved by get_state()
+    # Rows and columns are matched up by team identifier, service and inject number,
+    # so teams or services that were added since the state was saved start from zero
+    # and ones that were removed are dropped
+    def set_state(self, state: dict[str: np.ndarray]):
+        self.add_services(state['services'].tolist())
+        rows = [self.team_index.get(team_id) for team_id in state['team_ids'].tolist()]
+        kept = np.array([row is not None for row in rows], dtype=bool)
+        rows = np.array([row for row in rows if row is not None], dtype=np.intp)
+        columns = self.get_columns(state['services'].tolist())
+
+        self.points[np.ix_(rows, columns)] = state['points'][kept]
+        self.penalties[np.ix_(rows, columns)] = state['penalties'][kept]
+        self.sla_tracker[np.ix_(rows, columns)] = state['sla_tracker'][kept]
+
+        self.injects = state['injects'].tolist()
+        self.inject_index = {inject_num: i for i, inject_num in enumerate(self.injects)}
+        self.inject_points = np.zeros((len(self.team_ids), len(self.injects)), dtype=np.int64)
+        self.inject_points[rows] = state['inject_points'][kept]
+
+    #######################
+    # Totals
+
+    # Raw, penalty and total scores for every team, as arrays indexed by team row
+    def raw_scores(self) -> np.ndarray:
+        return self.points.sum(axis=1) + self.inject_points.sum(axis=1)
+
+    def penalty_scores(self) -> np.ndarray:
+        return self.penalties.sum(axis=1)
+
+    def total_scores(self) -> np.ndarray:
+        return self.raw_scores() - self.penalty_scores()
+
+    # Score breakdown for a single team
+    def get_team_totals(self, team_id: int) -> dict[str: int]:
+        row = self.team_index[team_id]
+        raw_score = int(self.points[row].sum() + self.inject_points[row].sum())
+        penalty_score = int(self.penalties[row].sum())
+        return {
+            'total_score': raw_score - penalty_score,
+            'raw_score': raw_score,
+            'penalty_score': penalty_score
+        }
+
+    def get_team_scores(self, team_id: int) -> dict[str: int]:
+        row = self.team_index[team_id]
+        scores = dict(zip(self.services, self.points[row].tolist()))
+        scores.update({
+            f'inject{inject_num}': points for inject_num, points in zip(self.injects, self.inject_points[row].tolist())
+        })
+        return scores
+
+    def get_team_penalties(self, team_id: int) -> dict[str: int]:
+        row = self.team_index[team_id]
+        return {f'sla-{service}': points for service, points in zip(self.services, self.penalties[row].tolist())}
+
+    def get_team_sla_tracker(self, team_id: int) -> dict[str: int]:
+        row = self.team_index[team_id]
+        return dict(zip(self.services, self.sla_tracker[row].tolist()))
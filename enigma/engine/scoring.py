@@ -1,20 +1,40 @@
+import json
 import random
 import time
-from os.path import join
-from sys import executable as interpreter
-import subprocess
-import threading
+from datetime import timedelta
 
-from enigma.checks import Service
+import numpy as np
 
 from enigma.logger import log
-from enigma.engine import static_path, checks_path
-from enigma.broker import RabbitMQ
+from enigma.engine import static_path, checkpoint_path, worker_settings, export_settings
+from enigma.engine.workers import create_check_executor
+from enigma.engine.scheduler import CheckScheduler, stagger_checks
+from enigma.engine.pipeline import PipelineStage
+from enigma.engine.environment import Environment
+from enigma.engine.plan import CheckPlan
+from enigma.engine.scoreboard import ScoreBoard
+from enigma.engine.checkpoint import Checkpoint
+from enigma.engine.rescoring import Rescore
+from enigma.engine.export import ScoreExporter, export_history
+from enigma.engine.timing import PhaseTimer
+from enigma.run_check import decode_result
+from enigma.broker import Broker
 
-from enigma.models.box import Box
 from enigma.models.credlist import Credlist
 from enigma.models.team import RvBTeam
 from enigma.models.settings import Settings
+from enigma.models.inject import InjectReport
+from enigma.models.scorereport import ScoreReport
+from enigma.models.slareport import SLAReport
+from enigma.models.roundresults import RoundResults
+from enigma.models.scoreindex import ScoreIndex
+from enigma.models.unitofwork import RoundUnitOfWork
+
+# Number of unacknowledged check results the broker will push to the engine at once
+result_prefetch = 250
+
+# How far back before the last inject grade change to look for grades committed late
+inject_overlap = timedelta(seconds=60)
 
 class ScoringEngine:
 
@@ -34,6 +54,11 @@ class RvBScoringEngine(ScoringEngine):
 
         self.update_comp()
         self.round = 1
+        self.overruns = 0
+        # Set when a round failed to tabulate, the scoring state is then ahead of the DB until resumed
+        self.tabulation_failed = False
+        self.exporter = None
+        self.timer = PhaseTimer()
         log.info("RvB scoring engine ready...")
 
     # Starts the scoring engine loop
@@ -46,6 +71,41 @@ class RvBScoringEngine(ScoringEngine):
             log.error('No teams detected, cannot start Enigma!')
             return
 
+        # Rounds are only ever written once, so scoring cannot start at a round the DB already has
+        if self.tabulation_failed:
+            log.error('A round failed to tabulate, resume from the last checkpoint before starting!')
+            self.engine_lock = False
+            return
+        last_round = RoundResults.last_round()
+        if self.round <= last_round:
+            log.error(f'Round {self.round} is already in the database, resume, rescore or reset before starting!')
+            self.engine_lock = False
+            return
+
+        # Starting check workers
+        self.workers = create_check_executor(worker_settings)
+        with self.timer.phase('startup'):
+            self.workers.start()
+
+        # Starting the score export
+        # A competition starting at round 1 starts a new history, anything left from before a reset is thrown away
+        if export_settings['format'] != 'none':
+            self.exporter = ScoreExporter(
+                export_settings['path'],
+                export_settings['format'],
+                export_settings['chunk_rounds']
+            )
+            self.exporter.open(append=self.round > 1)
+
+        # Starting background tabulation
+        self.tabulation = PipelineStage('Tabulation', self.tabulate_scores, on_error=self.on_tabulation_error)
+        self.tabulation.start()
+
+        # Round clock for fixed cadence scoring
+        # Round N starts at round_clock + (N - clock_round) * check_time + jitter
+        round_clock = time.monotonic()
+        clock_round = self.round
+
         # Main loop
         while (self.round <= total_rounds or total_rounds == 0) and not self.stop:
             # Checking for pause
@@ -55,26 +115,48 @@ class RvBScoringEngine(ScoringEngine):
                 while self.pause:
                     time.sleep(0.1)
                 log.info('Resuming scoring...')
+                round_clock = time.monotonic()
+                clock_round = self.round
 
-            # Updating boxes and services
+            # Updating boxes and services if the box config changed
             log.info('Retrieving up-to-date environment information')
-            self.boxes = Box.find_all()
-            self.services = Box.all_service_names(self.boxes)
+            if self.environment.refresh():
+                self.boxes = self.environment.boxes
+                self.services = self.environment.services
 
             # Run score checks
             log.info('Running score checks')
-            self.score_services()
+            with self.timer.phase('round'):
+                self.score_services()
 
-            log.info(f'Round {self.round} scoring complete! Waiting for next round start...')
+            # Replacing worn out check workers while the engine waits for the next round
+            self.workers.recycle()
+
+            log.info(f'Round {self.round} checks complete! Waiting for next round start...')
 
             if self.round == total_rounds or self.stop:
+                # Advancing round counter so a restart carries on from the next round
+                self.round = self.round + 1
                 break
 
+            settings = Settings.current()
             wait_jitter = random.randint(
-                -Settings.get_setting('check_jitter'),
-                Settings.get_setting('check_jitter')
+                -settings.check_jitter,
+                settings.check_jitter
             )
-            wait_time = Settings.get_setting('check_time') + wait_jitter
+            if settings.fixed_cadence:
+                # Waiting until the next round's slot on the round clock, no matter how long this round took
+                next_round_start = round_clock + (self.round + 1 - clock_round) * settings.check_time
+                wait_time = next_round_start + wait_jitter - time.monotonic()
+                if wait_time < 0:
+                    # Round overran its slot, starting the next round now and moving the round clock with it
+                    log.warning(f'Round {self.round} overran its slot by {-wait_time:.2f} seconds!')
+                    self.overruns = self.overruns + 1
+                    wait_time = 0
+                    round_clock = time.monotonic()
+                    clock_round = self.round + 1
+            else:
+                wait_time = settings.check_time + wait_jitter
             log.debug(f'Wait jitter: {wait_jitter} seconds')
             log.debug(f'Wait time: {wait_time} seconds')
 
@@ -85,6 +167,14 @@ class RvBScoringEngine(ScoringEngine):
 
         # Finishing up scoring
         log.info('Stopping scoring!')
+        if self.overruns:
+            log.warning(f'{self.overruns} rounds overran their slot on the round clock')
+        self.workers.close()
+        log.info('Waiting for tabulation to finish')
+        self.tabulation.close()
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
         self.stop = False
         self.pause = False
         self.engine_lock = False
@@ -100,176 +190,278 @@ class RvBScoringEngine(ScoringEngine):
     # Assumes a 'presumed guilty' model for score checks.
     # A check can be assumed to be False unless proven True
     # This is important for the timeout to work!
-    # Score checks are spawned in a separate process and are put on a timer
-    # As score checks results come in, they are sent to the main thread if they are true (presumed guilty means no need to report guilt)
-    # If all score checks do not finish before timeout, then the score check process will be forcibly terminated
-    # Any results thus sent are the only passed score checks
+    # Score checks are handed to the check worker pool and are put on a timer
+    # Every score check reports an explicit pass or fail result, so collection ends as soon as all of them are in
+    # If all score checks do not finish before timeout, then the workers running the late ones will be forcibly terminated
+    # Any score checks that never reported are left as failed
     def score_services(self):
         log.debug('Starting scoring services')
-        # Creating a dict full of score checks
-        # score_checks = {service name: {'func': scoring function, 'check_data': [all check data]}}
-        score_checks = []
-        first_octets = Settings.get_setting('first_octets')
-        for box in self.boxes:
-            for service in box.services:
-                for team in self.teams:
-                    # Default check options
-                    check_data = [
-                        f'{box.name}.{service.name}',
-                        f'{first_octets}.{team.identifier}.{box.identifier}'
-                    ]
-
-                    # Additional check options
-                    check_data.extend(
-                        self.get_check_options(
-                            service,
-                            team
-                        )
-                    )
-
-                    # Add to all score check data
-                    score_checks.append(
-                        check_data
-                    )
+        # Rebuilding the check plan only if the environment, teams or addressing changed
+        with self.timer.phase('plan'):
+            first_octets = Settings.current().first_octets
+            plan_key = CheckPlan.plan_key(self.environment.version, self.teams, first_octets)
+            if self.plan is None or plan_key != self.plan_key:
+                self.plan = CheckPlan(self.boxes, self.teams, first_octets)
+                self.plan_key = plan_key
+
+            # Filling in this round's check options
+            # score_checks = [((team identifier, service), check data)]
+            score_checks = self.plan.render(self.round)
 
         log.debug('Created score checks with check data')
 
         # Presumed guilty check results
-        # reports = {team identifier: {service: [result, msg]}}
-        reports = {}
-        for team in self.teams:
-            team_results = {}
-            for service in self.services:
-                team_results[service] = [False, 'Timed out']
-            reports[team.identifier] = team_results
+        # results is a matrix with a row per team and a column per service, True where the check passed
+        # msgs = {team identifier: {service: msg}}
+        services = self.services
+        service_columns = {service: i for i, service in enumerate(services)}
+        results = np.zeros((len(self.teams), len(services)), dtype=bool)
+        msgs = {team.identifier: dict.fromkeys(services, 'Timed out') for team in self.teams}
         log.debug('Created presumed guilty check results')
 
         # run score checks
-        results = self.run_score_checks(score_checks)
+        check_results = self.run_score_checks(score_checks)
         log.debug('Finished score checks, proceeding to update scores')
 
-        # Update results with proven innocent check results
-        for result in results:
-            reports[result[0]][result[1]][0] = True
-            reports[result[0]][result[1]][1] = result[2]
-        log.debug('Scores updated, proceeding to tabulate scores')
+        # Update results with reported check results
+        for team_id, service, passed, msg in check_results:
+            results[self.scoreboard.team_index[team_id], service_columns[service]] = passed
+            msgs[team_id][service] = msg
+        log.debug('Scores updated, handing off to tabulation')
 
-        # Tabulate scores for each team
-        for team in self.teams:
-            team.tabulate_scores(self.round, reports[team.identifier])
+        # Tabulation and DB writes run in the background so the next round is not held up by them
+        self.tabulation.submit(self.round, services, results, msgs)
 
         log.debug('Finished scoring services')
 
-    # Finds and applies check options for a service
-    def get_check_options(self, service: Service, team: RvBTeam):
-        log.debug(f'Creating check data for team {team.identifier} with service {service.name}')
-        check_options = []
-
-        # If check requires a credlist, get a random cred and add it to options
-        if hasattr(service, 'credlist'):
-            check_options.extend([
-                '--creds',
-                str(team.get_random_cred(service.credlist))
-            ])
-
-        # If check has a port, add to options
-        if hasattr(service, 'port'):
-            check_options.extend([
-                '--port',
-                str(service.port)
-            ])
-
-        # If check has auth methods, add to options
-        if hasattr(service, 'auth'):
-            check_options.extend([
-                '--auth',
-                str(service.auth)
-            ])
-
-        # If check has key file, add path to options
-        if hasattr(service, 'keyfile'):
-            check_options.extend([
-                '--keyfile',
-                str(service.keyfile)
-            ])
-
-        # If check has a specific path to check, add path to options
-        if hasattr(service, 'path'):
-            check_options.extend([
-                '--path',
-                str(service.path)
-            ])
-
-        return check_options
+    # Tabulate scores for all teams at once on the scoreboard
+    # Runs on the tabulation stage, one round at a time in round order so SLA tracking stays correct
+    # All of the round's DB writes are collected and written in a single transaction
+    # Once the round is written, the scoring state is checkpointed so the engine can be resumed from it
+    # and the round is appended to the score export
+    def tabulate_scores(self, round: int, services: list[str], results: np.ndarray, msgs: dict[int: dict]):
+        log.debug(f'Tabulating scores for round {round}')
+        tabulation_start = time.perf_counter()
+        settings = Settings.current()
+        self.apply_inject_reports()
+
+        violations = self.scoreboard.apply_round(
+            services,
+            results,
+            settings.check_points,
+            settings.sla_penalty,
+            settings.sla_requirement
+        )
+
+        uow = RoundUnitOfWork(round)
+        uow.add_round_results(
+            RoundResults(
+                round=round,
+                team_ids=self.scoreboard.team_ids,
+                services=services,
+                results=results
+            )
+        )
+        for team_row, service_column in np.argwhere(violations).tolist():
+            uow.add_sla_report(
+                SLAReport(
+                    team_id=self.scoreboard.team_ids[team_row],
+                    round=round,
+                    service=services[service_column]
+                )
+            )
+        log.debug(f'{len(uow.sla_reports)} SLA violations detected')
+
+        for team_id, total in zip(self.scoreboard.team_ids, self.scoreboard.total_scores().tolist()):
+            uow.add_score_report(
+                ScoreReport(
+                    team_id=team_id,
+                    round=round,
+                    score=total,
+                    msg=json.dumps(msgs[team_id])
+                )
+            )
+            uow.set_team_score(team_id, total)
+        for entry in ScoreIndex.from_scoreboard(round, self.scoreboard):
+            uow.add_score_index(entry)
+        self.timer.add('tabulation', time.perf_counter() - tabulation_start)
+
+        with self.timer.phase('persistence'):
+            written = uow.flush()
+        if not written:
+            raise RuntimeError(f'Round {round} scoring changes were not written')
+        with self.timer.phase('checkpoint'):
+            Checkpoint.new(round, self.scoreboard, self.inject_watermark).write(checkpoint_path)
+
+        if self.exporter is not None:
+            export_start = time.perf_counter()
+            columns = self.scoreboard.get_columns(services)
+            self.exporter.write_round(
+                round,
+                self.scoreboard.team_ids,
+                services,
+                results,
+                violations,
+                self.scoreboard.points[:, columns],
+                self.scoreboard.penalties[:, columns]
+            )
+            self.exporter.write_breakdowns(self.scoreboard)
+            self.timer.add('export', time.perf_counter() - export_start)
+        log.debug(f'Finished tabulating scores for round {round}')
+
+    # Called by the tabulation stage when a round fails anywhere in tabulate_scores
+    # The scoring state may already include the round, so nothing after it can be written or checkpointed
+    # The last checkpoint is still good to resume from
+    def on_tabulation_error(self, round: int):
+        log.error(f'Round {round} failed to tabulate, stopping scoring!')
+        self.tabulation_failed = True
+        self.stop = True
+
+    # Picks up inject grades that changed since the last round and applies them
+    # Reports are re-read from a little before the last change seen, in case a grade was committed late,
+    # and only grades that actually changed are applied
+    def apply_inject_reports(self):
+        inject_reports, latest = InjectReport.get_reports_since(
+            None if self.inject_watermark is None else self.inject_watermark - inject_overlap
+        )
+        self.inject_watermark = latest
+        for team_id, inject_num, score in inject_reports:
+            if team_id in self.scoreboard.team_index and self.scoreboard.set_inject_points(team_id, inject_num, score):
+                log.debug(f'Awarded inject points for inject {inject_num} to team {team_id}')
 
     # Run score checks
-    def run_score_checks(self, check_options: list[list]) -> list[tuple]:
+    # Check start times are spread across the 'check_spread' window so they do not all hit at once
+    # checks = [((team identifier, service), check data)]
+    def run_score_checks(self, checks: list[tuple]) -> list[tuple]:
         log.debug('Running scoring checks')
-        check_timeout = Settings.get_setting('check_timeout')
-
-        # First part of the subprocess.Popen args, with the python interpreter and the path of the run_check.py script
-        run_check = [
-            interpreter,
-            join(checks_path, 'run_check.py')
-        ]
-
-        # Custom check thread class that encapsulates a subprocess.Popen object
-        class CheckThread:
-            def __init__(self, args: list):
-                self.args = args
-                self.process = None
-
-            def run(self):
-                def target():
-                    self.process = subprocess.Popen(self.args)
-                thread = threading.Thread(target=target)
-                thread.start()
-
-            def kill(self):
-                self.process.kill()
-
-        # Creates CheckThreads for each service and runs
-        threads = []
-        for check_option in check_options:
-
-            args = run_check + check_option
-            thread = CheckThread(args)
-            threads.append(thread)
-            thread.run()
-
-        # Attaching to RabbitMQ queue for 'enigma.engine.results' and adding each results to returned list
+        settings = Settings.current()
+        check_timeout = settings.check_timeout
+        check_spread = settings.check_spread
+
+        # Checks that have not reported yet
+        # pending = {(team identifier, service)}
+        pending = set(key for key, check_data in checks)
+
+        # Attaching to the broker queue for 'enigma.engine.results' before any checks are run so no results are missed
         results = []
-        timeout = time.time() + check_timeout
-        with RabbitMQ() as rabbit:
-            result = rabbit.channel.queue_declare('results_queue', exclusive=True)
-            rabbit.channel.queue_bind(
+        with Broker.new() as broker:
+            result = broker.channel.queue_declare('results_queue', exclusive=True)
+            broker.channel.queue_bind(
                 exchange='enigma',
                 queue=result.method.queue,
                 routing_key='enigma.engine.results'
             )
 
-            while time.time() <= timeout:
-                method_frame, header_frame, body = rabbit.channel.basic_get(queue=result.method.queue, auto_ack=True)
-                if body != None:
-                    check_result = body.decode('utf-8')
-                    check_result = check_result.split('|')
-                    check_result[0] = int(check_result[0])
+            # Hands each score check to the check workers at its scheduled start time
+            collection_start = time.perf_counter()
+            scheduler = CheckScheduler(self.workers, check_timeout, self.round)
+            scheduler.start(stagger_checks(checks, check_spread))
+
+            # Results are pushed to the engine as they come in until every check has reported or the timeout is hit
+            # The connection sleeps on the socket in between, so waiting on checks costs no CPU
+            # Late results from an earlier round are dropped, since their checks already counted as timed out
+            def on_result_callback(channel, method, properties, body):
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+                round, check_result = decode_result(body)
+                if round != self.round:
+                    log.debug(f'Dropping late score check result from round {round}')
+                    return
+                key = (check_result[0], check_result[1])
+                if key in pending:
+                    pending.remove(key)
                     results.append(check_result)
-
-        # After timeout, kill each process
-        for thread in threads:
-            thread.kill()
+                if not pending:
+                    channel.stop_consuming()
+
+            if pending:
+                broker.channel.basic_qos(prefetch_count=result_prefetch)
+                broker.channel.basic_consume(
+                    queue=result.method.queue,
+                    on_message_callback=on_result_callback
+                )
+                deadline = broker.connection.call_later(check_spread + check_timeout, broker.channel.stop_consuming)
+                broker.channel.start_consuming()
+                broker.connection.remove_timeout(deadline)
+            scheduler.stop()
+            self.timer.add('dispatch', scheduler.dispatch_time)
+            self.timer.add('collection', time.perf_counter() - collection_start)
+
+        # After timeout, cancel only the checks that have not reported
+        if pending:
+            log.warning(f'{len(pending)} score checks timed out')
+            self.workers.cancel(scheduler.get_task_ids(pending))
         return results
 
+    # Restores the scoring state and round from the last checkpoint
+    # Returns False if there is no checkpoint to resume from, or if it is not for the last stored round
+    # A checkpoint from another round, or from before a reset, would score on from the wrong totals
+    def resume(self) -> bool:
+        checkpoint = Checkpoint.read(checkpoint_path)
+        if checkpoint is None:
+            log.warning('No checkpoint to resume from!')
+            return False
+        last_round = RoundResults.last_round()
+        if checkpoint.round != last_round:
+            log.error(f'Checkpoint is for round {checkpoint.round} but the last stored round is {last_round}, not resuming')
+            return False
+        checkpoint.restore(self.scoreboard)
+        self.inject_watermark = checkpoint.inject_watermark
+        self.round = checkpoint.round + 1
+        self.tabulation_failed = False
+        log.info(f'Restored scoring state from the end of round {checkpoint.round}')
+        return True
+
+    # Recomputes every team's service points, SLA streaks and penalties from the stored round results
+    # using the current settings, skipping excluded rounds
+    # Inject points are kept as they are
+    def rescore(self):
+        settings = Settings.current()
+        rescore = Rescore(
+            self.scoreboard.team_ids,
+            settings.check_points,
+            settings.sla_penalty,
+            settings.sla_requirement
+        )
+        rescore.run(self.scoreboard.inject_points.sum(axis=1))
+
+        state = self.scoreboard.get_state()
+        state.update({
+            'services': np.array(rescore.services, dtype=np.str_),
+            'points': rescore.points,
+            'penalties': rescore.penalties,
+            'sla_tracker': rescore.sla_tracker
+        })
+        self.scoreboard = ScoreBoard(self.scoreboard.team_ids, self.services)
+        self.scoreboard.set_state(state)
+        for team in self.teams:
+            team.attach_scoreboard(self.scoreboard)
+
+        Checkpoint.new(rescore.last_round, self.scoreboard, self.inject_watermark).write(checkpoint_path)
+
+    # Rewrites the full score history and team breakdowns from the DB
+    def export(self, format: str):
+        exporter = ScoreExporter(export_settings['path'], format, export_settings['chunk_rounds'])
+        export_history(exporter)
+        exporter.write_breakdowns(self.scoreboard)
+        log.info(f'Exported score history and breakdowns to {exporter.path}')
+
     def update_comp(self):
         log.info("Searching for RvB competition configurations")
-        self.boxes = Box.find_all()
+        self.environment = Environment()
+        self.environment.refresh()
+        self.boxes = self.environment.boxes
         self.credlists = Credlist.find_all()
-        self.services = Box.all_service_names(self.boxes)
+        self.services = self.environment.services
         log.info("RvB competition environment loaded")
 
         log.info("Searching for RvB teams")
-        self.teams = RvBTeam.find_all(self.services)
+        self.teams = RvBTeam.find_all()
+        self.scoreboard = ScoreBoard([team.identifier for team in self.teams], self.services)
+        for team in self.teams:
+            team.attach_scoreboard(self.scoreboard)
+        self.plan = None
+        self.plan_key = None
+        self.inject_watermark = None
 
         if len(self.teams) == 0:
             self.teams_detected = False
@@ -0,0 +1,46 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Phase timer
+# Adds up how long the engine spends in each phase of a round, for benchmarks and for spotting slow rounds
+# Phases can be timed from any thread, so the tabulation stage records into the same timer as the main loop
+class PhaseTimer:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def __repr__(self):
+        return '<{}> with phases {}'.format(type(self).__name__, list(self.phases.keys()))
+
+    # Records one run of a phase
+    def add(self, name: str, seconds: float):
+        with self.lock:
+            total, count, longest = self.phases.get(name, (0.0, 0, 0.0))
+            self.phases[name] = (total + seconds, count + 1, max(longest, seconds))
+
+    # Times the code run inside the with block as one run of a phase
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    # Gets the total, count, mean and longest time of every phase
+    def summary(self) -> dict[str: dict]:
+        with self.lock:
+            return {
+                name: {
+                    'total': total,
+                    'count': count,
+                    'mean': total / count,
+                    'max': longest
+                } for name, (total, count, longest) in self.phases.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.phases = {}
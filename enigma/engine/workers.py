@@ -0,0 +1,427 @@
+import multiprocessing
+import queue
+import threading
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+import pika
+
+from enigma.logger import log
+from enigma.broker import Broker, broker_backend, set_local_bridge, forward_local_bridge
+from enigma.run_check import (
+    conduct_check,
+    conduct_check_async,
+    publish_result,
+    declare_task_queue,
+    encode_task,
+    task_routing_key
+)
+
+# Seconds the pool waits for a new worker to connect to the broker before carrying on without it
+worker_ready_timeout = 60
+
+# Seconds on top of the check timeout that a retiring worker gets to exit before it is killed
+retire_grace = 5
+
+# Check worker process
+# Service plugins and the broker connection are set up once when the worker starts, then ready is set
+# and the worker pulls check data from the task queue until the pool sets retire
+# Tasks picked up after their deadline belong to a round that already timed out and are skipped
+# The worker writes the ID of the task it is running into current[index] so the pool knows what to kill,
+# and counts the checks it has run in completed[index] so the pool knows when to replace it
+# bridge is the pipe results are published to with the local broker, None with RabbitMQ
+def run_worker(index: int, tasks, current, completed, ready, retire, bridge):
+    set_local_bridge(bridge)
+    with Broker.new() as broker:
+        ready.set()
+        while not retire.is_set():
+            try:
+                task = tasks.get(timeout=1)
+            except queue.Empty:
+                # Keeps the broker connection alive between rounds
+                broker.connection.process_data_events(time_limit=0)
+                continue
+
+            # None is the signal to shut down
+            if task is None:
+                break
+
+            task_id, round, deadline, check_data = task
+            if time.time() > deadline:
+                continue
+
+            current[index] = task_id
+            try:
+                team, full_service_name, result = conduct_check(check_data)
+                publish_result(broker, round, team, full_service_name, result)
+            except Exception:
+                log.exception(f'Could not report score check {check_data[0]} for {check_data[1]}')
+            current[index] = -1
+            completed[index] = completed[index] + 1
+
+# Deadline of the check running in the current asyncio task, read by the check thread pool
+check_deadline = contextvars.ContextVar('check_deadline', default=None)
+
+# Thread pool for the blocking plugins of an asyncio check worker
+# A thread cannot be cancelled, so a blocking plugin that overruns keeps its thread after its check has timed out
+# The pool remembers the deadline of the check behind every call, so it can count the threads held past their deadline
+class CheckThreadPool(ThreadPoolExecutor):
+
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers=max_workers)
+        self.deadlines = {}
+        self.calls = count()
+        self.deadline_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        deadline = check_deadline.get()
+        if deadline is None:
+            return super().submit(fn, *args, **kwargs)
+        call = next(self.calls)
+        with self.deadline_lock:
+            self.deadlines[call] = deadline
+        future = super().submit(fn, *args, **kwargs)
+        # Calls cancelled before they got a thread are done too
+        future.add_done_callback(lambda future: self.forget(call))
+        return future
+
+    def forget(self, call: int):
+        with self.deadline_lock:
+            self.deadlines.pop(call, None)
+
+    # Counts the calls still running or waiting for a thread after their check's deadline
+    def count_stuck(self) -> int:
+        now = time.time()
+        with self.deadline_lock:
+            return sum(1 for deadline in self.deadlines.values() if deadline < now)
+
+# Asyncio check worker process
+# Works like run_worker, but runs up to concurrency checks at once on an event loop
+# Late checks are cancelled by the worker at their deadline, so the pool never kills these workers mid-round
+# Blocking plugins run on a CheckThreadPool, and the number of its threads held past their deadline is written
+# into stuck[index] so the pool can replace a worker that is losing its threads
+# The task queue is read on a thread of its own, so stuck plugins cannot stop the worker taking tasks
+def run_async_worker(index: int, tasks, current, completed, stuck, ready, retire, concurrency: int, bridge):
+    set_local_bridge(bridge)
+    asyncio.run(serve_async_checks(index, tasks, completed, stuck, ready, retire, concurrency))
+
+async def serve_async_checks(index: int, tasks, completed, stuck, ready, retire, concurrency: int):
+    loop = asyncio.get_running_loop()
+    plugin_threads = CheckThreadPool(concurrency)
+    loop.set_default_executor(plugin_threads)
+    task_reader = ThreadPoolExecutor(max_workers=1)
+    limit = asyncio.Semaphore(concurrency)
+    running = set()
+
+    with Broker.new() as broker:
+
+        async def run_check(round: int, deadline: float, check_data: list[str]):
+            check_deadline.set(deadline)
+            try:
+                team, full_service_name, result = await conduct_check_async(check_data, deadline)
+                publish_result(broker, round, team, full_service_name, result)
+            except Exception:
+                log.exception(f'Could not report score check {check_data[0]} for {check_data[1]}')
+            finally:
+                limit.release()
+                completed[index] = completed[index] + 1
+
+        ready.set()
+        while not retire.is_set():
+            stuck[index] = plugin_threads.count_stuck()
+            await limit.acquire()
+            try:
+                task = await loop.run_in_executor(task_reader, tasks.get, True, 1)
+            except queue.Empty:
+                limit.release()
+                # Keeps the broker connection alive between rounds
+                broker.connection.process_data_events(time_limit=0)
+                continue
+
+            # None is the signal to shut down
+            if task is None:
+                limit.release()
+                break
+
+            task_id, round, deadline, check_data = task
+            if time.time() > deadline:
+                limit.release()
+                continue
+
+            check = asyncio.create_task(run_check(round, deadline, check_data))
+            running.add(check)
+            check.add_done_callback(running.discard)
+
+        # Letting any checks still running report before the worker exits
+        if running:
+            await asyncio.wait(running)
+        task_reader.shutdown(wait=False)
+
+# A check worker process and the events the pool uses to talk to it
+# index is the worker's place in the pool's current, completed and stuck arrays
+# retire_by is when a retiring worker is killed if it has not exited, or None
+class CheckWorker:
+
+    def __init__(self, process, index: int, ready, retire):
+        self.process = process
+        self.index = index
+        self.ready = ready
+        self.retire = retire
+        self.retire_by = None
+
+    def __repr__(self):
+        return '<{}> with index {}'.format(type(self).__name__, self.index)
+
+# Pool of long-lived check worker processes
+# Workers are spawned rather than forked so they do not inherit the engine's DB and broker connections
+# Spawning a worker re-imports the engine, so it is kept off the round's critical path:
+# start() waits until every worker is ready, and workers that have run max_tasks checks are only replaced between rounds
+# by recycle(), with the old worker taking checks until its replacement is ready
+# Each slot has two indexes into current and completed, so a replacement can run alongside the worker it replaces
+# Workers that crash or get killed for running past the timeout are replaced straight away
+# If concurrency is given, each worker runs the asyncio check runtime with up to that many checks at once,
+# and asyncio workers with plugin threads stuck past their deadline are replaced between rounds as well
+# A retiring worker still running once every check it could hold is past its deadline is stuck, and is killed
+# With the local broker, workers publish results to a bridge that the pool forwards to the engine's router
+class CheckWorkerPool:
+
+    def __init__(self, size: int, max_tasks: int, concurrency: int | None = None):
+        self.size = size
+        self.max_tasks = max_tasks
+        self.concurrency = concurrency
+        self.context = multiprocessing.get_context('spawn')
+        self.tasks = self.context.Queue()
+        self.current = self.context.Array('q', [-1] * size * 2)
+        self.completed = self.context.Array('q', [0] * size * 2)
+        self.stuck = self.context.Array('q', [0] * size * 2)
+        self.bridge = self.context.Queue() if broker_backend == 'local' else None
+        self.workers = [None] * size
+        self.replacements = [None] * size
+        self.retiring = []
+        self.next_id = 0
+        self.check_timeout = 0
+        self.lock = threading.Lock()
+        self.running = False
+        log.debug(f'Created CheckWorkerPool with {self.size} workers')
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Spawns every worker, waits for them to be ready and starts watching for workers that need replacing
+    def start(self):
+        if self.concurrency is None:
+            log.info(f'Starting {self.size} check workers')
+        else:
+            log.info(f'Starting {self.size} asyncio check workers with {self.concurrency} checks each')
+        self.running = True
+        if self.bridge is not None:
+            threading.Thread(target=forward_local_bridge, args=(self.bridge,), daemon=True).start()
+        for slot in range(self.size):
+            self.workers[slot] = self.spawn(slot)
+        deadline = time.monotonic() + worker_ready_timeout
+        for worker in self.workers:
+            if not worker.ready.wait(max(deadline - time.monotonic(), 0)):
+                log.warning(f'Check worker {worker.index} was not ready after {worker_ready_timeout} seconds')
+        threading.Thread(target=self.maintain, daemon=True).start()
+
+    # Starts a fresh worker process using the given index
+    def spawn(self, index: int) -> CheckWorker:
+        self.current[index] = -1
+        self.completed[index] = 0
+        self.stuck[index] = 0
+        ready = self.context.Event()
+        retire = self.context.Event()
+        if self.concurrency is None:
+            target = run_worker
+            args = (index, self.tasks, self.current, self.completed, ready, retire, self.bridge)
+        else:
+            target = run_async_worker
+            args = (index, self.tasks, self.current, self.completed, self.stuck, ready, retire, self.concurrency,
+                    self.bridge)
+        process = self.context.Process(
+            target=target,
+            args=args,
+            daemon=True
+        )
+        process.start()
+        return CheckWorker(process, index, ready, retire)
+
+    # The index in a slot that the given worker is not using
+    def get_spare_index(self, worker: CheckWorker) -> int:
+        return worker.index + self.size if worker.index < self.size else worker.index - self.size
+
+    # Starts replacements for workers that have run max_tasks checks or have plugin threads stuck past their deadline
+    # Called between rounds, the old workers keep taking checks until maintain() swaps their replacements in
+    def recycle(self):
+        with self.lock:
+            retiring_indexes = set(worker.index for worker in self.retiring)
+            for slot, worker in enumerate(self.workers):
+                spare_index = self.get_spare_index(worker)
+                if self.replacements[slot] is not None or spare_index in retiring_indexes:
+                    continue
+                if self.stuck[worker.index] > 0:
+                    log.warning(
+                        f'Check worker {worker.index} has {self.stuck[worker.index]} checks stuck past their deadline, '
+                        'starting a replacement'
+                    )
+                    self.replacements[slot] = self.spawn(spare_index)
+                elif self.max_tasks > 0 and self.completed[worker.index] >= self.max_tasks:
+                    log.debug(f'Starting a replacement for check worker {worker.index}')
+                    self.replacements[slot] = self.spawn(spare_index)
+
+    # Swaps in replacements once they are ready, replaces workers that have exited and cleans up retired workers
+    def maintain(self):
+        while self.running:
+            with self.lock:
+                for slot, worker in enumerate(self.workers):
+                    if not self.running:
+                        break
+                    replacement = self.replacements[slot]
+                    if replacement is not None and replacement.ready.is_set():
+                        worker.retire.set()
+                        # Any check the worker holds or picks up before it sees retire ends within the check timeout
+                        worker.retire_by = time.time() + self.check_timeout + retire_grace
+                        self.retiring.append(worker)
+                        self.workers[slot] = replacement
+                        self.replacements[slot] = None
+                    elif not worker.process.is_alive():
+                        log.debug(f'Replacing check worker {worker.index}')
+                        worker.process.join()
+                        self.workers[slot] = self.spawn(worker.index)
+                for worker in list(self.retiring):
+                    if worker.process.is_alive() and time.time() > worker.retire_by:
+                        log.debug(f'Killing retiring check worker {worker.index} for not exiting')
+                        worker.process.kill()
+                    if not worker.process.is_alive():
+                        worker.process.join()
+                        self.retiring.remove(worker)
+            time.sleep(0.5)
+
+    # Hands a round's check data to the workers and returns the task IDs assigned to them
+    # Checks not started within check_timeout seconds are skipped
+    def submit(self, check_data: list[list[str]], check_timeout: int, round: int) -> list[int]:
+        deadline = time.time() + check_timeout
+        task_ids = []
+        with self.lock:
+            self.check_timeout = check_timeout
+            for data in check_data:
+                self.tasks.put((self.next_id, round, deadline, data))
+                task_ids.append(self.next_id)
+                self.next_id = self.next_id + 1
+        return task_ids
+
+    # Cancels the given tasks
+    # Workers still running one are killed, and replaced unless they were already retiring
+    def cancel(self, task_ids: list[int]):
+        if not task_ids:
+            return
+        task_ids = set(task_ids)
+        with self.lock:
+            for slot, worker in enumerate(self.workers):
+                if self.current[worker.index] in task_ids:
+                    log.debug(f'Killing check worker {worker.index} for running past the timeout')
+                    worker.process.kill()
+                    worker.process.join()
+                    self.workers[slot] = self.spawn(worker.index)
+            for worker in self.retiring:
+                if self.current[worker.index] in task_ids:
+                    log.debug(f'Killing retiring check worker {worker.index} for running past the timeout')
+                    worker.process.kill()
+
+    # Shuts down every worker
+    def close(self):
+        log.info('Stopping check workers')
+        self.running = False
+        with self.lock:
+            workers = self.workers + [worker for worker in self.replacements if worker is not None] + self.retiring
+            for worker in workers:
+                worker.retire.set()
+                self.tasks.put(None)
+            for worker in workers:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+            if self.bridge is not None:
+                self.bridge.put(None)
+
+# Sends checks to check worker nodes through the durable check task queue
+# Any number of nodes running 'run_check.py --worker' can pull from the queue
+# Worker nodes are remote, so late checks cannot be killed; they are skipped once their deadline passes instead
+class CheckTaskQueue:
+
+    def __init__(self):
+        self.next_id = 0
+        self.broker = None
+        log.debug('Created CheckTaskQueue')
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        log.info('Sending score checks to check worker nodes')
+        with Broker.new() as broker:
+            declare_task_queue(broker)
+
+    # Publishes a batch of a round's check data to the check task queue and returns the task IDs assigned to them
+    # The publishing connection is opened by the round's first batch and kept for the rest of the round
+    def submit(self, check_data: list[list[str]], check_timeout: int, round: int) -> list[int]:
+        deadline = time.time() + check_timeout
+        task_ids = []
+        if self.broker is None:
+            self.broker = Broker.new()
+        for data in check_data:
+            self.broker.channel.basic_publish(
+                exchange='enigma',
+                routing_key=task_routing_key,
+                body=encode_task(data, deadline, round),
+                properties=pika.BasicProperties(
+                    delivery_mode=2,
+                    expiration=str(check_timeout * 1000)
+                )
+            )
+            task_ids.append(self.next_id)
+            self.next_id = self.next_id + 1
+        return task_ids
+
+    def cancel(self, task_ids: list[int]):
+        if task_ids:
+            log.debug(f'{len(task_ids)} score checks on worker nodes will expire at their deadline')
+
+    # Worker nodes are run and restarted outside the engine, so there are no workers to replace between rounds
+    # The round's publishing connection is closed instead, since it would sit idle and miss heartbeats until the next round
+    def recycle(self):
+        self.close_broker()
+
+    def close_broker(self):
+        if self.broker is not None:
+            self.broker.close()
+            self.broker = None
+
+    def close(self):
+        self.close_broker()
+        log.info('Stopped sending score checks to check worker nodes')
+
+# Creates the check executor selected by worker_settings['executor']
+# Worker nodes need a broker they can reach, so the check task queue cannot be used with the local broker
+def create_check_executor(settings: dict) -> CheckWorkerPool | CheckTaskQueue:
+    match settings['executor']:
+        case 'queue':
+            if broker_backend == 'local':
+                log.critical('Check worker nodes cannot reach the local broker, use the pool or async executor!')
+                raise SystemExit(1)
+            return CheckTaskQueue()
+        case 'async':
+            return CheckWorkerPool(settings['pool_size'], settings['max_tasks'], settings['concurrency'])
+        case _:
+            return CheckWorkerPool(settings['pool_size'], settings['max_tasks'])
@@ -1,4 +1,5 @@
 import json
+import sys
 
 from sqlmodel import Session, select
 
@@ -8,11 +9,25 @@ from enigma import possible_services
 from enigma.engine.database import db_engine
 from enigma.logger import log
 
-from db_models import BoxDB
+from db_models import BoxDB, ConfigVersionDB
+
+# Compiled services, shared by every box with the same service config
+# service_cache = {(service type, config json): Service}
+service_cache = {}
+
+# Gets the shared Service for a service config, creating it the first time the config is seen
+# Services are never changed once created, so one instance can be used by every box and team
+def get_service(service: str, config: dict) -> Service:
+    key = (service, json.dumps(config, sort_keys=True))
+    if key not in service_cache:
+        service_cache[key] = possible_services[service].new(config)
+    return service_cache[key]
 
 # Box
 class Box:
 
+    __slots__ = ('name', 'identifier', 'service_config', 'services')
+
     def __init__(self, name: str, identifier: int, service_config: dict):
         self.name = name
         self.identifier = identifier
@@ -24,21 +39,23 @@ class Box:
         return '<Box> named \'{}\' with identifier \'{}\' and services {}'.format(self.name, self.identifier, self.services)
     
     # Get every service for the box in the format 'box.service'
+    # Names are interned so every team, check and scoreboard column shares the same string
     def get_service_names(self):
         log.debug(f"Finding formatted service names for {self.name}")
         names = list()
-        for service in self.compile_services():
-            names.append(f'{self.name}.{service.name}')
+        for service in self.services:
+            names.append(sys.intern(f'{self.name}.{service.name}'))
         return names
 
     # Takes a dict of service config data and creates new Service objects based off of them
+    # This is done once when the Box is created, use self.services for the compiled services
     def compile_services(self) -> list[Service]:
         log.debug(f"Compiling services for {self.name}")
         services = list()
         from_json = self.service_config
         for service, config in from_json.items():
             if service in possible_services.keys():
-                services.append(possible_services[service].new(from_json[service]))
+                services.append(get_service(service, config))
 
         return services
 
@@ -80,6 +97,30 @@ class Box:
                 )
         return boxes
 
+    # Fetches all Box from the DB, but only if the box config no longer matches version
+    # version is a counter bumped by a DB trigger on every change to the boxes table,
+    # so an unchanged config costs a single row read instead of reading every box
+    # Returns the current version and the boxes, or None for the boxes if the config is unchanged
+    @classmethod
+    def find_all_if_changed(cls, version: int | None) -> tuple[int, list | None]:
+        log.debug(f"Checking box config version")
+        with Session(db_engine) as session:
+            current_version = session.get(ConfigVersionDB, 'boxes').version
+            if current_version == version:
+                return current_version, None
+
+            log.debug(f"Box config changed, retrieving all boxes from database")
+            boxes = []
+            for box in session.exec(select(BoxDB).order_by(BoxDB.name)).all():
+                boxes.append(
+                    Box.new(
+                        name=box.name,
+                        identifier=box.identifier,
+                        data=box.service_config
+                    )
+                )
+            return current_version, boxes
+
     # Gets the names of all the services
     @classmethod
     def all_service_names(cls, boxes: list):
@@ -1,4 +1,5 @@
 import json
+import random
 
 from sqlmodel import Session, select
 
@@ -81,7 +82,11 @@ class TeamCreds:
         try:
             with Session(db_engine) as session:
                 session.add(
-                    self
+                    TeamCredsDB(
+                        name=self.name,
+                        team_id=self.team_id,
+                        creds=json.dumps(self.creds)
+                    )
                 )
                 session.commit()
             return True
@@ -89,6 +94,21 @@ class TeamCreds:
             log.warning(f"Failed to add team creds for team with ID {self.team_id}!")
             return False
 
+    # Updates the creds in DB
+    def update_in_db(self):
+        log.debug(f"Updating team creds {self.name} in database for team with ID {self.team_id}")
+        with Session(db_engine) as session:
+            session.exec(
+                select(
+                    TeamCredsDB
+                ).where(
+                    TeamCredsDB.name == self.name
+                ).where(
+                    TeamCredsDB.team_id == self.team_id
+                )
+            ).one().creds = json.dumps(self.creds)
+            session.commit()
+
     @classmethod
     def fetch_from_db(cls, name: str, team_id: int):
         log.debug(f"Fetching team creds for team with ID {team_id}")
@@ -104,8 +124,9 @@ class TeamCreds:
             ).one()
             return json.loads(db_teamcred.creds)
 
+    # Fetches every credlist for a team as dict[credlist name: creds]
     @classmethod
-    def fetch_all(cls, team_id: int):
+    def fetch_all(cls, team_id: int) -> dict[str: dict]:
         log.debug(f"Fetching all team creds for team with ID {team_id}")
         with Session(db_engine) as session:
             db_teamcreds = session.exec(
@@ -115,4 +136,45 @@ class TeamCreds:
                     TeamCredsDB.team_id == team_id
                 )
             ).all()
-            return [teamcreds.creds for teamcreds in db_teamcreds]
\ No newline at end of file
+            return {teamcreds.name: json.loads(teamcreds.creds) for teamcreds in db_teamcreds}
+
+# CredIndex
+# Indexed in-memory copy of a team's credlist
+# Creds are kept as a list of (user, password) pairs so a random pick is O(1),
+# with a position index by user so a single cred can be changed in O(1)
+class CredIndex:
+
+    def __init__(self, creds: dict):
+        self.pairs = list(creds.items())
+        self.positions = {user: i for i, (user, password) in enumerate(self.pairs)}
+
+    def __repr__(self):
+        return '<{}> with {} creds'.format(type(self).__name__, len(self.pairs))
+
+    def __len__(self):
+        return len(self.pairs)
+
+    # Picks a random (user, password) pair
+    def random_cred(self) -> tuple[str, str]:
+        return random.choice(self.pairs)
+
+    # Adds a cred or changes the password of an existing one
+    def set_cred(self, user: str, password: str):
+        if user in self.positions:
+            self.pairs[self.positions[user]] = (user, password)
+        else:
+            self.positions[user] = len(self.pairs)
+            self.pairs.append((user, password))
+
+    # Removes a cred by swapping the last pair into its place
+    def remove_cred(self, user: str):
+        if user not in self.positions:
+            return
+        i = self.positions.pop(user)
+        last = self.pairs.pop()
+        if i < len(self.pairs):
+            self.pairs[i] = last
+            self.positions[last[0]] = i
+
+    def to_dict(self) -> dict:
+        return dict(self.pairs)
\ No newline at end of file
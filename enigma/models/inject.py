@@ -1,4 +1,5 @@
 import json
+from datetime import datetime
 
 from sqlmodel import Session, select
 
@@ -134,4 +135,17 @@ class InjectReport:
                     InjectReportDB.team_id == team_id
                 )
             ).all()
-            return [(db_report.inject_num, db_report.score) for db_report in db_reports]
\ No newline at end of file
+            return [(db_report.inject_num, db_report.score) for db_report in db_reports]
+
+    # Fetches every InjectReport for all teams that changed at or after since, or all of them if since is None
+    # Returns the reports as [(team_id, inject_num, score)] and the latest change time seen
+    @classmethod
+    def get_reports_since(cls, since: datetime | None) -> tuple[list[tuple[int, int, int]], datetime | None]:
+        log.debug(f"Finding all InjectReport changed since {since}")
+        with Session(db_engine) as session:
+            query = select(InjectReportDB)
+            if since is not None:
+                query = query.where(InjectReportDB.updated >= since)
+            db_reports = session.exec(query).all()
+            latest = max((db_report.updated for db_report in db_reports if db_report.updated), default=since)
+            return [(db_report.team_id, db_report.inject_num, db_report.score) for db_report in db_reports], latest
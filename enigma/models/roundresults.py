@@ -0,0 +1,116 @@
+import json
+
+import numpy as np
+from sqlmodel import Session, select, update, func
+
+from enigma.logger import log
+from enigma.engine.database import db_engine
+
+from db_models import RoundResultsDB
+
+# Round results
+# The pass/fail result of every score check in a round, kept so scores can be recomputed later
+# results is a boolean matrix with a row per team in team_ids and a column per service in services
+# Excluded rounds have been thrown out and are skipped when rescoring
+class RoundResults:
+
+    def __init__(self, round: int, team_ids: list[int], services: list[str], results: np.ndarray, excluded: bool = False):
+        self.round = round
+        self.team_ids = team_ids
+        self.services = services
+        self.results = results
+        self.excluded = excluded
+
+    def __repr__(self):
+        return '<{}> for round {} with {} teams and {} services'.format(
+            type(self).__name__,
+            self.round,
+            len(self.team_ids),
+            len(self.services)
+        )
+
+    # Packs the results into a DB row
+    def to_row(self) -> dict:
+        return {
+            'round': self.round,
+            'team_ids': json.dumps(self.team_ids),
+            'services': json.dumps(self.services),
+            'results': np.packbits(self.results, axis=None).tobytes(),
+            'excluded': self.excluded
+        }
+
+    #######################
+    # DB fetch/add
+
+    def add_to_db(self):
+        log.debug(f'Adding round results for round {self.round} to database')
+        with Session(db_engine) as session:
+            session.add(
+                RoundResultsDB(**self.to_row())
+            )
+            session.commit()
+
+    # Streams every stored round in round order
+    # Rows are fetched batch_size at a time, so the whole history is never loaded into the session at once
+    # Pass the caller's session to stream inside it, so an in-memory database's single connection is not asked for twice
+    @classmethod
+    def stream(cls, batch_size: int = 500, session: Session | None = None):
+        if session is None:
+            with Session(db_engine) as session:
+                yield from cls.stream(batch_size, session)
+            return
+        log.debug('Streaming round results from database')
+        db_rounds = session.exec(
+            select(
+                RoundResultsDB
+            ).order_by(
+                RoundResultsDB.round
+            ).execution_options(
+                yield_per=batch_size
+            )
+        )
+        for db_round in db_rounds:
+            yield cls.new(db_round)
+
+    # Gets the last round with stored results, or 0 if there are none
+    @classmethod
+    def last_round(cls) -> int:
+        log.debug('Finding last stored round')
+        with Session(db_engine) as session:
+            last_round = session.exec(select(func.max(RoundResultsDB.round))).one()
+            return 0 if last_round is None else last_round
+
+    # Marks a round as thrown out, or brings it back
+    # Returns False if there are no results stored for the round
+    @classmethod
+    def set_excluded(cls, round: int, excluded: bool) -> bool:
+        log.debug(f'Setting round {round} excluded to {excluded}')
+        with Session(db_engine) as session:
+            result = session.exec(
+                update(
+                    RoundResultsDB
+                ).where(
+                    RoundResultsDB.round == round
+                ).values(
+                    excluded=excluded
+                )
+            )
+            session.commit()
+            return result.rowcount > 0
+
+    # Creates a RoundResults object from a DB row
+    @classmethod
+    def new(cls, db_round: RoundResultsDB):
+        team_ids = json.loads(db_round.team_ids)
+        services = json.loads(db_round.services)
+        results = np.unpackbits(
+            np.frombuffer(db_round.results, dtype=np.uint8),
+            count=len(team_ids) * len(services)
+        ).reshape(len(team_ids), len(services)).astype(bool)
+        return cls(
+            round=db_round.round,
+            team_ids=team_ids,
+            services=services,
+            results=results,
+            excluded=db_round.excluded
+        )
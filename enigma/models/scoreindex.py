@@ -0,0 +1,103 @@
+import json
+
+from sqlmodel import Session, select
+
+from enigma.logger import log
+from enigma.engine.database import db_engine
+from enigma.engine.scoreboard import ScoreBoard
+
+from db_models import ScoreIndexDB
+
+# Score index
+# A team's running scores as of the end of a round
+# services = {service: [points, penalty points]}
+class ScoreIndex:
+
+    def __init__(self, team_id: int, round: int, total_score: int, raw_score: int, penalty_score: int, services: dict):
+        self.team_id = team_id
+        self.round = round
+        self.total_score = total_score
+        self.raw_score = raw_score
+        self.penalty_score = penalty_score
+        self.services = services
+
+    def __repr__(self):
+        return '<{}> for team {} at round {} with total score {}'.format(
+            type(self).__name__,
+            self.team_id,
+            self.round,
+            self.total_score
+        )
+
+    # Packs the index entry into a DB row
+    def to_row(self) -> dict:
+        return {
+            'round': self.round,
+            'team_id': self.team_id,
+            'total_score': self.total_score,
+            'raw_score': self.raw_score,
+            'penalty_score': self.penalty_score,
+            'services': json.dumps(self.services)
+        }
+
+    # Creates an index entry for every team from the scoreboard as it stands at the end of a round
+    @classmethod
+    def from_scoreboard(cls, round: int, scoreboard: ScoreBoard) -> list:
+        raw_scores = scoreboard.raw_scores().tolist()
+        penalty_scores = scoreboard.penalty_scores().tolist()
+        points = scoreboard.points.tolist()
+        penalties = scoreboard.penalties.tolist()
+        entries = []
+        for i, team_id in enumerate(scoreboard.team_ids):
+            entries.append(
+                cls(
+                    team_id=team_id,
+                    round=round,
+                    total_score=raw_scores[i] - penalty_scores[i],
+                    raw_score=raw_scores[i],
+                    penalty_score=penalty_scores[i],
+                    services={
+                        service: [service_points, service_penalty]
+                        for service, service_points, service_penalty in zip(scoreboard.services, points[i], penalties[i])
+                    }
+                )
+            )
+        return entries
+
+    #######################
+    # DB fetch/add
+
+    # Streams every index entry in round order, then team order
+    # Rows are fetched batch_size at a time, so the whole index is never loaded into the session at once
+    # Pass the caller's session to stream inside it, as with RoundResults.stream()
+    @classmethod
+    def stream(cls, batch_size: int = 5000, session: Session | None = None):
+        if session is None:
+            with Session(db_engine) as session:
+                yield from cls.stream(batch_size, session)
+            return
+        log.debug('Streaming score index from database')
+        db_entries = session.exec(
+            select(
+                ScoreIndexDB
+            ).order_by(
+                ScoreIndexDB.round,
+                ScoreIndexDB.team_id
+            ).execution_options(
+                yield_per=batch_size
+            )
+        )
+        for db_entry in db_entries:
+            yield cls.new(db_entry)
+
+    # Creates a ScoreIndex object from a DB row
+    @classmethod
+    def new(cls, db_entry: ScoreIndexDB):
+        return cls(
+            team_id=db_entry.team_id,
+            round=db_entry.round,
+            total_score=db_entry.total_score,
+            raw_score=db_entry.raw_score,
+            penalty_score=db_entry.penalty_score,
+            services=json.loads(db_entry.services)
+        )
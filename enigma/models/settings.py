@@ -1,3 +1,5 @@
+import threading
+
 from sqlmodel import Session, select, delete
 
 from enigma.engine.database import db_engine
@@ -6,8 +8,16 @@ from enigma.logger import log
 from db_models import SettingsDB
 
 # Settings
+# A process-wide snapshot of the settings is loaded once and shared
+# Read settings with plain attribute access on Settings.current()
+# The snapshot is reloaded by Settings.refresh(), which is called on the 'update' command and on a Postgres NOTIFY
 class Settings:
 
+    # Postgres NOTIFY channel that is signalled whenever the settings table changes
+    notify_channel = 'enigma_settings'
+
+    _current = None
+
     def __init__(self, **kwargs):
         setting_keys = [
             'id',
@@ -18,6 +28,8 @@ class Settings:
             'check_time',
             'check_jitter',
             'check_timeout',
+            'check_spread',
+            'fixed_cadence',
             'check_points',
             'sla_requirement',
             'sla_penalty',
@@ -28,8 +40,57 @@ class Settings:
             if k in setting_keys:
                 setattr(self, k, v)
 
+    #######################
+    # Snapshot methods
+
+    # Gets the current settings snapshot, loading it if needed
+    @classmethod
+    def current(cls) -> 'Settings':
+        if cls._current is None:
+            cls.refresh()
+        return cls._current
+
+    # Reloads the settings snapshot from the DB
+    # The whole snapshot is swapped at once, so readers never see a mix of old and new settings
+    @classmethod
+    def refresh(cls):
+        log.debug('Loading settings from database')
+        with Session(db_engine) as session:
+            db_settings = session.exec(select(SettingsDB)).one()
+            cls._current = cls(**db_settings.model_dump())
+
+    # Reloads the settings snapshot whenever Postgres signals a change to the settings table
+    # Does nothing for databases without LISTEN/NOTIFY
+    @classmethod
+    def listen(cls):
+        if db_engine.dialect.name != 'postgresql':
+            return
+
+        def target():
+            connection = db_engine.raw_connection()
+            try:
+                connection.driver_connection.autocommit = True
+                connection.driver_connection.execute(f'LISTEN {cls.notify_channel}')
+                for notify in connection.driver_connection.notifies():
+                    log.info('Settings changed, reloading')
+                    cls.refresh()
+            except Exception:
+                log.exception('Stopped listening for settings changes')
+            finally:
+                connection.close()
+
+        threading.Thread(target=target, daemon=True).start()
+        log.debug('Listening for settings changes')
+
     #######################
     # DB fetch/add
+
+    # Checks if the DB already holds settings
+    @classmethod
+    def exists(cls) -> bool:
+        with Session(db_engine) as session:
+            return session.exec(select(SettingsDB)).first() is not None
+
     def add_to_db(self):
         log.debug(f'Adding settings to database')
         with Session(db_engine) as session:
@@ -42,13 +103,11 @@ class Settings:
                 setattr(settings, attr, getattr(self, attr))
 
             session.add(
-                SettingsDB()
+                settings
             )
             session.commit()
+        Settings.refresh()
 
     @classmethod
     def get_setting(cls, key: str):
-        log.debug(f'Locating setting: {key}')
-        with Session(db_engine) as session:
-            settings = session.exec(select(SettingsDB)).one()
-            return getattr(settings, key)
\ No newline at end of file
+        return getattr(cls.current(), key)
@@ -0,0 +1,94 @@
+from sqlmodel import Session, insert, update, case
+
+from enigma.logger import log
+from enigma.engine.database import db_engine
+from enigma.models.scorereport import ScoreReport
+from enigma.models.slareport import SLAReport
+from enigma.models.roundresults import RoundResults
+from enigma.models.scoreindex import ScoreIndex
+
+from db_models import ScoreReportDB, SLAReportDB, RoundResultsDB, ScoreIndexDB, RvBTeamDB
+
+# Round unit of work
+# Collects every scoring change made while tabulating a round and writes them all in one transaction
+# Score and SLA reports are written with multi-row inserts, and team totals with a single UPDATE
+class RoundUnitOfWork:
+
+    def __init__(self, round: int):
+        self.round = round
+        self.score_reports = []
+        self.sla_reports = []
+        self.round_results = []
+        self.score_index = []
+        self.team_scores = {}
+
+    def __repr__(self):
+        return '<{}> for round {} with {} score reports, {} SLA reports and {} team scores'.format(
+            type(self).__name__,
+            self.round,
+            len(self.score_reports),
+            len(self.sla_reports),
+            len(self.team_scores)
+        )
+
+    def add_score_report(self, report: ScoreReport):
+        self.score_reports.append({
+            'team_id': report.team_id,
+            'round': report.round,
+            'score': report.score,
+            'msg': report.msg
+        })
+
+    def add_sla_report(self, report: SLAReport):
+        self.sla_reports.append({
+            'team_id': report.team_id,
+            'round': report.round,
+            'service': report.service
+        })
+
+    def add_round_results(self, results: RoundResults):
+        self.round_results.append(results.to_row())
+
+    def add_score_index(self, entry: ScoreIndex):
+        self.score_index.append(entry.to_row())
+
+    def set_team_score(self, team_id: int, score: int):
+        self.team_scores[team_id] = score
+
+    #######################
+    # DB fetch/add
+
+    # Writes everything collected for the round in one transaction
+    # Returns False if the write failed, in which case nothing for the round was written
+    def flush(self) -> bool:
+        log.debug(f'Writing round {self.round} scoring changes to database')
+        try:
+            with Session(db_engine) as session:
+                if self.score_reports:
+                    session.exec(insert(ScoreReportDB), params=self.score_reports)
+                if self.sla_reports:
+                    session.exec(insert(SLAReportDB), params=self.sla_reports)
+                if self.round_results:
+                    session.exec(insert(RoundResultsDB), params=self.round_results)
+                if self.score_index:
+                    session.exec(insert(ScoreIndexDB), params=self.score_index)
+                if self.team_scores:
+                    session.exec(
+                        update(
+                            RvBTeamDB
+                        ).where(
+                            RvBTeamDB.identifier.in_(self.team_scores.keys())
+                        ).values(
+                            score=case(self.team_scores, value=RvBTeamDB.identifier)
+                        )
+                    )
+                session.commit()
+        except Exception:
+            log.exception(f'Failed to write round {self.round} scoring changes to database!')
+            return False
+        self.score_reports = []
+        self.sla_reports = []
+        self.round_results = []
+        self.score_index = []
+        self.team_scores = {}
+        return True
@@ -1,7 +1,11 @@
 import sys
+import json
+import time
+import asyncio
 
 from enigma import possible_services
-from enigma.broker import RabbitMQ
+from enigma.broker import Broker, broker_backend
+from enigma.logger import log
 
 # run_check.py SERVICE ADDR [OPTIONS]
 # -p, --port    Assigns a custom port
@@ -9,15 +13,27 @@ from enigma.broker import RabbitMQ
 # -k, --keyfile Keyfile
 # -c, --creds   Creds to use
 # -P, --path    Path to check
-if __name__ == '__main__':
-    full_service_name = sys.argv[1]
+# -m, --model   Model for synthetic checks, as JSON
+# -r, --round   Round number, for checks that need it
+#
+# run_check.py --worker
+# -w, --worker  Runs as a check worker node, pulling checks from the check task queue
+
+# Durable work queue on the 'enigma' exchange that check worker nodes pull checks from
+task_queue = 'check_tasks'
+task_routing_key = 'enigma.checks.tasks'
+
+# Parses check data into the service name, team, address, and service args
+# check_data is the same list of arguments that run_check.py takes on the command line
+def parse_check_data(check_data: list[str]) -> tuple[str, int, str, dict]:
+    full_service_name = check_data[0]
 
-    team = int(sys.argv[2].split('.')[2])
-    addr = sys.argv[2]
+    team = int(check_data[1].split('.')[2])
+    addr = check_data[1]
     args = {}
-    for i in [opt for opt in range(3, len(sys.argv)) if opt % 2 == 1]:
-        arg = sys.argv[i]
-        opt = sys.argv[i + 1]
+    for i in [opt for opt in range(2, len(check_data)) if opt % 2 == 0]:
+        arg = check_data[i]
+        opt = check_data[i + 1]
 
         while arg.startswith('-'):
             arg = arg[1:]
@@ -33,17 +49,132 @@ if __name__ == '__main__':
                 args['creds'] = opt
             case 'P' | 'path':
                 args['path'] = opt
+            case 'm' | 'model':
+                args['model'] = opt
+            case 'r' | 'round':
+                args['round'] = opt
             case _:
                 pass
 
-    service = possible_services[sys.argv[1].split('.')[1]].new(args)
-    result = service.conduct_service_check(addr=addr)
-
-    with RabbitMQ() as rabbit:
-        message = f'{team}|{full_service_name}|{result[1]}'
-        if result[0]:
-            rabbit.channel.basic_publish(
-                exchange='enigma',
-                routing_key='enigma.engine.results',
-                body=message
-            )
\ No newline at end of file
+    return full_service_name, team, addr, args
+
+# Conducts a single score check and returns the team, full service name, and check result
+# A check that errors out counts as a failed check so that it still reports a result
+def conduct_check(check_data: list[str]) -> tuple[int, str, tuple[bool, str]]:
+    full_service_name, team, addr, args = parse_check_data(check_data)
+    try:
+        service = possible_services[full_service_name.split('.')[1]].new(args)
+        result = service.conduct_service_check(addr=addr)
+    except (Exception, SystemExit):
+        log.exception(f'Score check {full_service_name} for {addr} failed to run')
+        result = (False, 'Check failed to run')
+    return team, full_service_name, result
+
+# Async version of conduct_check used by the asyncio check runtime
+# A check still running at its deadline is cancelled and counts as timed out
+async def conduct_check_async(check_data: list[str], deadline: float) -> tuple[int, str, tuple[bool, str]]:
+    full_service_name, team, addr, args = parse_check_data(check_data)
+    try:
+        service = possible_services[full_service_name.split('.')[1]].new(args)
+        result = await asyncio.wait_for(
+            service.conduct_service_check_async(addr=addr),
+            timeout=max(deadline - time.time(), 0)
+        )
+    except TimeoutError:
+        result = (False, 'Timed out')
+    except (Exception, SystemExit):
+        log.exception(f'Score check {full_service_name} for {addr} failed to run')
+        result = (False, 'Check failed to run')
+    return team, full_service_name, result
+
+# Publishes a check result to 'enigma.engine.results'
+# Every check publishes a result, pass or fail
+# The round the check was run for is sent with it, so a result that arrives after its round ended is not credited to the next one
+# Message format is 'round|team|full service name|1 or 0|message'
+def publish_result(broker: Broker, round: int, team: int, full_service_name: str, result: tuple[bool, str]):
+    message = f'{round}|{team}|{full_service_name}|{int(result[0])}|{result[1]}'
+    broker.channel.basic_publish(
+        exchange='enigma',
+        routing_key='enigma.engine.results',
+        body=message
+    )
+
+# Decodes a published check result into round and [team, full service name, result, message]
+def decode_result(body: bytes) -> tuple[int, list]:
+    round, *check_result = body.decode('utf-8').split('|', 4)
+    check_result[0] = int(check_result[0])
+    check_result[1] = sys.intern(check_result[1])
+    check_result[2] = check_result[2] == '1'
+    return int(round), check_result
+
+#######################
+# Check task queue
+
+# Declares the check task queue and binds it to the 'enigma' exchange
+def declare_task_queue(broker: Broker):
+    broker.channel.queue_declare(task_queue, durable=True)
+    broker.channel.queue_bind(
+        exchange='enigma',
+        queue=task_queue,
+        routing_key=task_routing_key
+    )
+
+# Encodes check data as a task for the check task queue
+# Worker nodes skip any task they pick up after its deadline
+def encode_task(check_data: list[str], deadline: float, round: int) -> str:
+    return json.dumps({
+        'round': round,
+        'deadline': deadline,
+        'check_data': check_data
+    })
+
+# Consumes the check task queue, conducting each check and publishing its result
+# broker can be any Broker backend
+def run_worker_node(broker: Broker):
+    declare_task_queue(broker)
+
+    def on_task_callback(channel, method, properties, body):
+        task = json.loads(body.decode('utf-8'))
+        check_data = task['check_data']
+        if time.time() <= task['deadline']:
+            team, full_service_name, result = conduct_check(check_data)
+            publish_result(broker, task['round'], team, full_service_name, result)
+        else:
+            log.debug(f'Skipping expired score check {check_data[0]} for {check_data[1]}')
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    broker.channel.basic_qos(prefetch_count=1)
+    broker.channel.basic_consume(
+        queue=task_queue,
+        on_message_callback=on_task_callback
+    )
+    try:
+        broker.channel.start_consuming()
+    except KeyboardInterrupt:
+        broker.channel.stop_consuming()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or (sys.argv[1] not in ('-w', '--worker') and len(sys.argv) < 3):
+        print('Usage: run_check.py SERVICE ADDR [OPTIONS]')
+        print('       run_check.py --worker')
+        raise SystemExit(1)
+
+    if sys.argv[1] in ('-w', '--worker'):
+        if broker_backend == 'local':
+            log.critical('Check worker nodes need RabbitMQ, the local broker only reaches the engine process!')
+            raise SystemExit(1)
+        log.info('Starting check worker node')
+        with Broker.new() as broker:
+            run_worker_node(broker)
+        raise SystemExit(0)
+
+    team, full_service_name, result = conduct_check(sys.argv[1:])
+    round = int(parse_check_data(sys.argv[1:])[3].get('round', 0))
+
+    # Nothing else can see a local broker in this process, so the result is only logged
+    if broker_backend == 'local':
+        log.info(f'Score check {full_service_name} for team {team}: {result}')
+        raise SystemExit(0)
+
+    with Broker.new() as broker:
+        publish_result(broker, round, team, full_service_name, result)
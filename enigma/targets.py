@@ -0,0 +1,296 @@
+import sys
+import ssl
+import random
+import asyncio
+import resource
+import subprocess
+from os.path import join
+from tempfile import mkdtemp
+
+import asyncssh
+
+from enigma.logger import log
+from enigma.models.credlist import TeamCreds
+
+# targets.py [OPTIONS]
+# Runs a farm of mock score check targets on this machine for load testing the check pipeline end to end
+# A target is started for every team, box and service in the DB, listening on first_octets.team.box
+# Linux routes all of 127.0.0.0/8 to loopback, so with first_octets set to '127.0' no network setup is needed
+# -l, --latency         Seconds each target waits before answering, default 0
+# -j, --jitter          Up to this many extra seconds are added to the latency at random, default 0
+# -f, --failure-rate    Chance that a request fails, default 0
+# -F, --flap-period     Seconds each target stays up and then down, 0 for never, default 0
+# -s, --seed            Seed for latency, failures and flapping
+# -c, --certfile        TLS cert for HTTPS targets, a self-signed cert is made with openssl if not given
+# -k, --keyfile         TLS key for HTTPS targets
+# -A, --authorized-keys Public keys SSH targets accept for pubkey logins, in authorized_keys format
+
+# Protocol each kind of service is served with, and its default port
+target_protocols = {
+    'http': ('http', 80),
+    'https': ('https', 443),
+    'ssh': ('ssh', 22),
+    'tcp': ('tcp', None)
+}
+
+# Seconds between reloads of the team creds SSH targets check logins against, so changed creds are picked up
+creds_refresh = 10
+
+# SSH server for SSH targets
+# Password logins are checked against the team's current creds in the target's credlists,
+# and pubkey logins as any user against the farm's authorized keys
+class TargetSSHServer(asyncssh.SSHServer):
+
+    def __init__(self, target):
+        self.target = target
+
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def password_auth_supported(self) -> bool:
+        return True
+
+    def public_key_auth_supported(self) -> bool:
+        return bool(self.target.farm.authorized_keys)
+
+    async def validate_password(self, username: str, password: str) -> bool:
+        return await self.target.login(self.target.check_password(username, password))
+
+    async def validate_public_key(self, username: str, key: asyncssh.SSHKey) -> bool:
+        return await self.target.login(key.public_data in self.target.farm.authorized_keys)
+
+# Mock target
+# Serves one service on one address
+# A failed request gets an HTTP 500 for HTTP and HTTPS, and a denied login for SSH
+# Plain TCP targets always accept, so they only fail while flapped down
+# A flapped down target stops listening, so connections to it are refused
+class Target:
+
+    def __init__(self, farm, protocol: str, host: str, port: int, team_id: int = None, credlists: list[str] = None):
+        self.farm = farm
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+        self.team_id = team_id
+        self.credlists = credlists or []
+        self.server = None
+
+    def __repr__(self):
+        return '<{}> serving {} on {}:{}'.format(type(self).__name__, self.protocol, self.host, self.port)
+
+    async def start(self):
+        if self.protocol == 'ssh':
+            self.server = await asyncssh.create_server(
+                lambda: TargetSSHServer(self),
+                self.host,
+                self.port,
+                server_host_keys=[self.farm.host_key],
+                reuse_address=True
+            )
+            return
+        self.server = await asyncio.start_server(
+            self.handle,
+            self.host,
+            self.port,
+            ssl=self.farm.tls_context if self.protocol == 'https' else None,
+            reuse_address=True
+        )
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    # Flaps the target down and up for as long as the farm runs
+    # Targets start their flapping at different points so they do not all go down together
+    async def flap(self):
+        await asyncio.sleep(self.farm.random.uniform(0, self.farm.flap_period))
+        while True:
+            if self.server is None:
+                await self.start()
+            else:
+                await self.stop()
+            await asyncio.sleep(self.farm.flap_period)
+
+    # Checks a password against the team's creds in this target's credlists
+    def check_password(self, user: str, password: str) -> bool:
+        team_creds = self.farm.team_creds.get(self.team_id, {})
+        return any(team_creds.get(credlist, {}).get(user) == password for credlist in self.credlists)
+
+    # Answers an SSH login after the farm's latency, denying it on a failed request
+    async def login(self, valid: bool) -> bool:
+        failed = self.farm.random.random() < self.farm.failure_rate
+        await asyncio.sleep(self.farm.get_latency())
+        return valid and not failed
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        failed = self.farm.random.random() < self.farm.failure_rate
+        try:
+            if self.protocol in ('http', 'https'):
+                await reader.readuntil(b'\r\n\r\n')
+            await asyncio.sleep(self.farm.get_latency())
+            match self.protocol:
+                case 'http' | 'https':
+                    body = b'Internal Server Error' if failed else b'OK'
+                    status = b'500 Internal Server Error' if failed else b'200 OK'
+                    writer.write(
+                        b'HTTP/1.1 ' + status + b'\r\n'
+                        + b'Content-Type: text/plain\r\n'
+                        + b'Content-Length: ' + str(len(body)).encode('utf-8') + b'\r\n'
+                        + b'Connection: close\r\n\r\n'
+                        + body
+                    )
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+# Target farm
+# Holds the shared behaviour settings and runs every target on one event loop
+class TargetFarm:
+
+    def __init__(self, latency: float = 0, jitter: float = 0, failure_rate: float = 0, flap_period: float = 0,
+                 seed: int = None, tls_context: ssl.SSLContext = None, authorized_keys: list[bytes] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.flap_period = flap_period
+        self.random = random.Random(seed)
+        self.tls_context = tls_context
+        self.authorized_keys = authorized_keys or []
+        self.host_key = None
+        self.team_creds = {}
+        self.targets = []
+
+    def __repr__(self):
+        return '<{}> with {} targets'.format(type(self).__name__, len(self.targets))
+
+    def get_latency(self) -> float:
+        if self.jitter > 0:
+            return self.latency + self.random.uniform(0, self.jitter)
+        return self.latency
+
+    def add_target(self, protocol: str, host: str, port: int, team_id: int = None, credlists: list[str] = None):
+        if protocol == 'https' and self.tls_context is None:
+            log.warning(f'No TLS cert, skipping HTTPS target on {host}:{port}')
+            return
+        # Every SSH target shares one throwaway host key, since checks do not verify host keys
+        if protocol == 'ssh' and self.host_key is None:
+            self.host_key = asyncssh.generate_private_key('ssh-ed25519')
+        self.targets.append(Target(self, protocol, host, port, team_id, credlists))
+
+    # Loads the current creds of every team with an SSH target
+    def load_team_creds(self):
+        team_ids = {target.team_id for target in self.targets if target.protocol == 'ssh'}
+        self.team_creds = {team_id: TeamCreds.fetch_all(team_id) for team_id in team_ids}
+
+    # Reloads the team creds for as long as the farm runs, so SSH targets follow cred changes
+    async def refresh_team_creds(self):
+        while True:
+            await asyncio.sleep(creds_refresh)
+            await asyncio.to_thread(self.load_team_creds)
+
+    # Adds a target for every service on every box for every team
+    # Services the farm cannot serve, such as random or synthetic checks, are skipped
+    def add_competition(self, boxes: list, teams: list, first_octets: str):
+        for team in teams:
+            for box in boxes:
+                host = f'{first_octets}.{team.identifier}.{box.identifier}'
+                for service in box.services:
+                    if service.name not in target_protocols:
+                        continue
+                    protocol, default_port = target_protocols[service.name]
+                    port = int(getattr(service, 'port', default_port))
+                    self.add_target(protocol, host, port, team.identifier, getattr(service, 'credlist', None))
+        self.load_team_creds()
+        log.info(f'Added {len(self.targets)} targets')
+
+    # Starts every target and serves until cancelled
+    async def serve(self):
+        raise_file_limit()
+        await asyncio.gather(*[target.start() for target in self.targets])
+        log.info(f'Serving {len(self.targets)} targets')
+        tasks = [self.refresh_team_creds()]
+        if self.flap_period > 0:
+            tasks.extend([target.flap() for target in self.targets])
+        await asyncio.gather(*tasks)
+
+# Raises the open file limit as far as allowed, since every target holds a listening socket
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+# Creates the TLS context for HTTPS targets
+# If no cert is given, a throwaway self-signed cert is made with openssl
+def create_tls_context(certfile: str = None, keyfile: str = None) -> ssl.SSLContext | None:
+    if certfile is None:
+        cert_path = mkdtemp(prefix='enigma-targets-')
+        certfile = join(cert_path, 'cert.pem')
+        keyfile = join(cert_path, 'key.pem')
+        try:
+            subprocess.run(
+                [
+                    'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                    '-keyout', keyfile, '-out', certfile, '-days', '1', '-subj', '/CN=enigma-target'
+                ],
+                check=True,
+                capture_output=True
+            )
+        except (OSError, subprocess.CalledProcessError):
+            log.warning('Could not create a self-signed cert with openssl, HTTPS targets are disabled')
+            return None
+    tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    tls_context.load_cert_chain(certfile, keyfile)
+    return tls_context
+
+if __name__ == '__main__':
+    from enigma.models.box import Box
+    from enigma.models.team import RvBTeam
+    from enigma.models.settings import Settings
+
+    options = {
+        'latency': 0.0,
+        'jitter': 0.0,
+        'failure_rate': 0.0,
+        'flap_period': 0.0,
+        'seed': None
+    }
+    certfile = None
+    keyfile = None
+    authorized_keys = None
+    args = sys.argv[1:]
+    for i in [opt for opt in range(0, len(args)) if opt % 2 == 0]:
+        match args[i]:
+            case '-l' | '--latency':
+                options['latency'] = float(args[i + 1])
+            case '-j' | '--jitter':
+                options['jitter'] = float(args[i + 1])
+            case '-f' | '--failure-rate':
+                options['failure_rate'] = float(args[i + 1])
+            case '-F' | '--flap-period':
+                options['flap_period'] = float(args[i + 1])
+            case '-s' | '--seed':
+                options['seed'] = int(args[i + 1])
+            case '-c' | '--certfile':
+                certfile = args[i + 1]
+            case '-k' | '--keyfile':
+                keyfile = args[i + 1]
+            case '-A' | '--authorized-keys':
+                authorized_keys = [key.public_data for key in asyncssh.read_public_key_list(args[i + 1])]
+            case _:
+                log.error(f'Unknown option {args[i]}')
+                raise SystemExit(1)
+
+    farm = TargetFarm(tls_context=create_tls_context(certfile, keyfile), authorized_keys=authorized_keys, **options)
+    farm.add_competition(
+        Box.find_all(),
+        RvBTeam.find_all(),
+        Settings.current().first_octets
+    )
+    try:
+        asyncio.run(farm.serve())
+    except KeyboardInterrupt:
+        log.info('Stopping target farm')
@@ -0,0 +1,229 @@
+import sys
+import json
+import math
+import hashlib
+import time
+import resource
+
+from enigma.logger import log, write_log_header
+
+from enigma.engine import worker_settings
+from enigma.engine.database import del_db, init_db
+from enigma.engine.scoring import RvBScoringEngine
+
+from enigma.models.box import Box
+from enigma.models.team import RvBTeam
+from enigma.models.settings import Settings
+
+# benchmark.py --reset [OPTIONS]
+# Builds a synthetic competition of N teams x M boxes x K services and times full scoring rounds against it
+# Every check is a seeded synthetic check, so no targets are needed and every run with the same options scores the same
+# The benchmark replaces all competition data in the database, so --reset must be given
+# -r, --reset           Does a reset of the database first
+# -t, --teams           Number of teams, default 10
+# -b, --boxes           Number of boxes per team, default 5
+# -s, --services        Number of services per box, default 4
+# -n, --rounds          Number of rounds to run, default 5
+# -l, --latency         Base latency of every check in seconds, default 0
+# -m, --latency-model   fixed, normal or longtail, default fixed
+# -d, --latency-spread  Spread of the normal or longtail latency, default 0
+# -p, --pass-rate       Chance that a check passes, default 1
+# -F, --fail-teams      Comma separated team identifiers whose checks always fail
+# -f, --flap-period     Rounds each service stays up and then down, default 0 for never
+# -o, --outage-rate     Chance that an outage of every team starts in a round, default 0
+# -O, --outage-length   Rounds an outage lasts, default 1
+# -S, --seed            Seed for the synthetic checks, default 0
+# -j, --json            Also writes the results as JSON to this file
+
+# Phases reported, in the order they happen in a round
+phases = [
+    'startup',
+    'plan',
+    'dispatch',
+    'collection',
+    'round',
+    'tabulation',
+    'persistence',
+    'checkpoint',
+    'export'
+]
+
+# Creates the synthetic competition
+# A box config holds one service of each kind, so each of the K services on a box is set up as its own box
+# This gives the same N x M x K checks per round, with service names in the format 'box<m>s<k>.synthetic'
+# Each service gets its own seed from the model seed, so services do not all pass and fail together
+def create_competition(teams: int, boxes: int, services: int, model: dict):
+    if teams > 255 or boxes * services > 255:
+        log.critical('Teams and boxes x services must each be at most 255!')
+        raise SystemExit(1)
+
+    Settings(
+        comp_name='benchmark',
+        check_time=0,
+        check_jitter=0,
+        check_spread=0,
+        check_timeout=max(5, int(get_max_latency(model)) + 5),
+        fixed_cadence=False
+    ).add_to_db()
+
+    for m in range(boxes):
+        for k in range(services):
+            Box(
+                name=f'box{m + 1}s{k + 1}',
+                identifier=m * services + k + 1,
+                service_config={
+                    'synthetic': model | {
+                        'seed': f'{model["seed"]}.{m + 1}.{k + 1}'
+                    }
+                }
+            ).add_to_db()
+
+    for i in range(teams):
+        RvBTeam.new(
+            name=f'team{i + 1}',
+            identifier=i + 1
+        ).add_to_db()
+
+# Latency that almost no check goes over, used to set a check timeout that does not cut off modelled checks
+# Timed out checks would fail on how busy the machine is rather than on the model
+def get_max_latency(model: dict) -> float:
+    match model['latency_model']:
+        case 'normal':
+            return model['latency'] + 5 * model['latency_spread']
+        case 'longtail':
+            return model['latency'] * math.exp(5 * model['latency_spread'])
+    return model['latency']
+
+# Peak resident set size of this process and of its finished child processes, in MiB
+def get_peak_rss() -> dict[str: float]:
+    return {
+        'engine': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'workers': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    }
+
+# Short fingerprint of the final scores, to check that two runs scored the same
+def get_score_digest(total_scores: dict[int: int]) -> str:
+    scores = ','.join(f'{team_id}:{score}' for team_id, score in sorted(total_scores.items()))
+    return hashlib.sha256(scores.encode('utf-8')).hexdigest()[:16]
+
+def print_report(report: dict):
+    print()
+    print('Enigma scoring benchmark')
+    print(f'{report["teams"]} teams x {report["boxes"]} boxes x {report["services"]} services, '
+          f'{report["checks_per_round"]} checks per round, {report["rounds"]} rounds, '
+          f'{report["model"]["latency_model"]} {report["model"]["latency"]}s check latency, {report["executor"]} executor')
+    print()
+    print(f'{"phase":<12}{"total (s)":>12}{"mean (s)":>12}{"max (s)":>12}{"runs":>8}')
+    for phase in phases:
+        if phase in report['phases']:
+            timing = report['phases'][phase]
+            print(f'{phase:<12}{timing["total"]:>12.4f}{timing["mean"]:>12.4f}{timing["max"]:>12.4f}{timing["count"]:>8}')
+    print()
+    print(f'Wall time:        {report["wall_time"]:.3f}s')
+    print(f'Checks per second: {report["checks_per_second"]:.1f}')
+    print(f'Peak RSS:         {report["peak_rss"]["engine"]:.1f} MiB engine, {report["peak_rss"]["workers"]:.1f} MiB largest worker')
+    # Runs with the same options should always end on the same scores
+    print(f'Score digest:     {get_score_digest(report["total_scores"])}')
+
+if __name__ == '__main__':
+
+    write_log_header()
+
+    reset = False
+    teams = 10
+    boxes = 5
+    services = 4
+    rounds = 5
+    model = {
+        'latency': 0.0,
+        'latency_model': 'fixed',
+        'latency_spread': 0.0,
+        'pass_rate': 1.0,
+        'fail_teams': [],
+        'flap_period': 0,
+        'outage_rate': 0.0,
+        'outage_length': 1,
+        'seed': 0
+    }
+    json_path = None
+
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        match args[i]:
+            case '-r' | '--reset':
+                reset = True
+                i = i + 1
+                continue
+            case '-t' | '--teams':
+                teams = int(args[i + 1])
+            case '-b' | '--boxes':
+                boxes = int(args[i + 1])
+            case '-s' | '--services':
+                services = int(args[i + 1])
+            case '-n' | '--rounds':
+                rounds = int(args[i + 1])
+            case '-l' | '--latency':
+                model['latency'] = float(args[i + 1])
+            case '-m' | '--latency-model':
+                model['latency_model'] = args[i + 1]
+            case '-d' | '--latency-spread':
+                model['latency_spread'] = float(args[i + 1])
+            case '-p' | '--pass-rate':
+                model['pass_rate'] = float(args[i + 1])
+            case '-F' | '--fail-teams':
+                model['fail_teams'] = [int(team) for team in args[i + 1].split(',')]
+            case '-f' | '--flap-period':
+                model['flap_period'] = int(args[i + 1])
+            case '-o' | '--outage-rate':
+                model['outage_rate'] = float(args[i + 1])
+            case '-O' | '--outage-length':
+                model['outage_length'] = int(args[i + 1])
+            case '-S' | '--seed':
+                model['seed'] = int(args[i + 1])
+            case '-j' | '--json':
+                json_path = args[i + 1]
+            case _:
+                log.error(f'Unknown option {args[i]}')
+                raise SystemExit(1)
+        i = i + 2
+
+    if not reset:
+        log.error('The benchmark replaces all competition data, run it with --reset to confirm')
+        raise SystemExit(1)
+
+    log.info('Resetting database...')
+    del_db()
+    init_db()
+
+    log.info(f'Creating synthetic competition of {teams} teams x {boxes} boxes x {services} services')
+    create_competition(teams, boxes, services, model)
+
+    engine = RvBScoringEngine()
+    wall_start = time.perf_counter()
+    engine.run(rounds)
+    wall_time = time.perf_counter() - wall_start
+
+    summary = engine.timer.summary()
+    checks_per_round = teams * boxes * services
+    round_time = summary['round']['total'] if 'round' in summary else wall_time
+    report = {
+        'teams': teams,
+        'boxes': boxes,
+        'services': services,
+        'rounds': rounds,
+        'model': model,
+        'executor': worker_settings['executor'],
+        'checks_per_round': checks_per_round,
+        'phases': summary,
+        'wall_time': wall_time,
+        'checks_per_second': checks_per_round * rounds / round_time if round_time else 0,
+        'peak_rss': get_peak_rss(),
+        'total_scores': dict(zip(engine.scoreboard.team_ids, engine.scoreboard.total_scores().tolist()))
+    }
+
+    print_report(report)
+    if json_path is not None:
+        with open(json_path, 'w+') as f:
+            json.dump(report, f, indent=4)
+        log.info(f'Wrote benchmark results to {json_path}')
@@ -24,13 +24,21 @@ if __name__ == '__main__':
                 case '-r' | '--reset':
                     log.info("Resetting database...")
                     del_db()
-                    init_db()
                 case _:
                     pass
 
+    # Creating any missing tables and triggers, existing data is kept
+    init_db()
+
+    # Applying default settings only to a new database, so a restart keeps the competition's settings
+    if Settings.exists():
+        log.info("Keeping existing settings")
+    else:
+        log.info("Applying default settings...")
+        Settings().add_to_db()
+    Settings.listen()
+
     # Creating CMD object
-    log.info("Applying default settings...")
-    Settings().add_to_db()
 
     log.info("Enigma Scoring Engine initialized!")
     engine = RvBCMD()
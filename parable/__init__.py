@@ -14,5 +14,11 @@ postgres_settings = {
     'port': getenv('POSTGRES_PORT')
 }
 
+# Database URL, must point at the same database as the engine's ENIGMA_DATABASE_URL
+database_url = getenv(
+    'ENIGMA_DATABASE_URL',
+    'postgresql+psycopg://{user}:{password}@{host}:{port}/enigma'.format(**postgres_settings)
+)
+
 def create_app(test_config=None):
     pass
\ No newline at end of file
@@ -1,8 +1,36 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlmodel import create_engine
 
-from parable import postgres_settings
+from parable import database_url
 
-db_engine = create_engine(
-    f'postgresql+psycopg://{postgres_settings['user']}:{postgres_settings['password']}@{postgres_settings['host']}:{postgres_settings['port']}/enigma',
-    echo=False
-)
\ No newline at end of file
+# Same SQLite pragmas as the engine, so both sides agree on WAL and locking
+sqlite_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 30000,
+    'foreign_keys': 'ON',
+    'temp_store': 'MEMORY',
+    'cache_size': -65536
+}
+
+def create_db_engine(url: str):
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(url, echo=False)
+
+    options = {
+        'connect_args': {'check_same_thread': False}
+    }
+    engine = create_engine(url, echo=False, **options)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in sqlite_pragmas.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        cursor.close()
+
+    return engine
+
+db_engine = create_db_engine(database_url)
@@ -8,4 +8,10 @@ postgres_settings = {
     'password': getenv('POSTGRES_PASSWORD'),
     'host': getenv('POSTGRES_HOST'),
     'port': getenv('POSTGRES_PORT')
-}
\ No newline at end of file
+}
+
+# Database URL, must point at the same database as the engine's ENIGMA_DATABASE_URL
+database_url = getenv(
+    'ENIGMA_DATABASE_URL',
+    'postgresql+psycopg://{user}:{password}@{host}:{port}/enigma'.format(**postgres_settings)
+)
\ No newline at end of file
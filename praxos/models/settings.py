@@ -17,6 +17,8 @@ class Settings:
             'check_time',
             'check_jitter',
             'check_timeout',
+            'check_spread',
+            'fixed_cadence',
             'check_points',
             'sla_requirement',
             'sla_penalty',
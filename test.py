@@ -10,7 +10,7 @@ from enigma.models.box import Box
 from enigma.models.settings import Settings
 from enigma.models.credlist import Credlist
 from enigma.models.team import RvBTeam
-from enigma.broker import RabbitMQ
+from enigma.broker import Broker
 
 boxes_path = './example_configs/boxes'
 creds_path = './example_configs/creds'
@@ -57,8 +57,7 @@ for path in listdir(creds_path):
 for i in range(5):
     team = RvBTeam(
         name=f'coolteam{i+1}',
-        identifier=i+1,
-        services=Box.all_service_names(boxes)
+        identifier=i+1
     )
     teams.append(team)
     team.add_to_db()"""
@@ -67,8 +66,8 @@ Settings(first_octets='10.10', sla_requirement=2)
 
 while True:
     cmd = input('Enter command: ')
-    with RabbitMQ() as rabbit:
-        rabbit.channel.basic_publish(
+    with Broker.new() as broker:
+        broker.channel.basic_publish(
             exchange='enigma',
             routing_key='enigma.engine.cmd',
             body=cmd
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+from os.path import join, dirname, abspath
+
+import pytest
+
+# The engine reads its settings from the environment when it is first imported, so they are set here before any test imports it
+# Every test run gets its own SQLite database, checkpoint and export directories, and the in-process broker
+test_path = tempfile.mkdtemp(prefix='enigma-tests-')
+os.environ['ENIGMA_DATABASE_URL'] = f'sqlite:///{join(test_path, "enigma.db")}'
+os.environ['ENIGMA_BROKER'] = 'local'
+os.environ['ENIGMA_CHECK_EXECUTOR'] = 'pool'
+os.environ['ENIGMA_WORKERS'] = '2'
+os.environ['ENIGMA_CHECKPOINT_PATH'] = join(test_path, 'checkpoints')
+os.environ['ENIGMA_EXPORT_PATH'] = join(test_path, 'export')
+os.environ['ENIGMA_EXPORT_FORMAT'] = 'csv'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+# The logger writes to logs/ under the working directory
+os.makedirs(join(os.getcwd(), 'logs'), exist_ok=True)
+
+# The benchmark harness builds the synthetic competitions the engine tests run on
+repo_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, join(repo_path, 'main', 'enigma'))
+
+# Model for synthetic checks, see benchmark.py
+def synthetic_model(pass_rate: float = 1.0, seed: int = 0, **kwargs) -> dict:
+    return {
+        'latency': 0.0,
+        'latency_model': 'fixed',
+        'latency_spread': 0.0,
+        'pass_rate': pass_rate,
+        'fail_teams': [],
+        'flap_period': 0,
+        'outage_rate': 0.0,
+        'outage_length': 1,
+        'seed': seed
+    } | kwargs
+
+# Resets the database and builds a synthetic competition of teams x boxes x services
+@pytest.fixture
+def competition():
+    from benchmark import create_competition
+    from enigma.engine.database import del_db, init_db
+
+    def create(teams: int = 4, boxes: int = 2, services: int = 2, **model):
+        del_db()
+        init_db()
+        create_competition(teams, boxes, services, synthetic_model(**model))
+
+    return create
@@ -0,0 +1,22 @@
+import pytest
+
+from benchmark import get_score_digest
+
+from enigma.engine import worker_settings
+from enigma.engine.scoring import RvBScoringEngine
+
+# Digest of the final scores of the reference benchmark run
+# benchmark.py --reset -t 20 -b 5 -s 4 -n 8 -p 0.7 -f 2 -o 0.2 -O 2 -S 1
+# Synthetic checks are seeded, so any change to how rounds are scored shows up as a different digest
+reference_digest = '86aac0ca40427945'
+
+@pytest.mark.parametrize('executor', ['pool', 'async'])
+def test_benchmark_scores_match_reference(competition, monkeypatch, executor):
+    monkeypatch.setitem(worker_settings, 'executor', executor)
+    competition(teams=20, boxes=5, services=4, pass_rate=0.7, flap_period=2, outage_rate=0.2, outage_length=2, seed=1)
+
+    engine = RvBScoringEngine()
+    engine.run(8)
+
+    total_scores = dict(zip(engine.scoreboard.team_ids, engine.scoreboard.total_scores().tolist()))
+    assert get_score_digest(total_scores) == reference_digest
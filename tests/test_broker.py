@@ -0,0 +1,87 @@
+import queue
+
+from enigma.broker import Broker, LocalRouter, topic_matches
+
+def words(key: str) -> tuple[str]:
+    return tuple(key.split('.'))
+
+def test_topic_wildcards():
+    assert topic_matches(words('enigma.engine.results'), words('enigma.engine.results'))
+    assert topic_matches(words('enigma.*.results'), words('enigma.engine.results'))
+    assert not topic_matches(words('enigma.*.results'), words('enigma.engine.checks.results'))
+    assert topic_matches(words('enigma.#'), words('enigma.engine.results'))
+    assert topic_matches(words('enigma.#'), words('enigma'))
+    assert topic_matches(words('#.results'), words('enigma.engine.results'))
+    assert topic_matches(words('enigma.#.results'), words('enigma.results'))
+    assert not topic_matches(words('enigma.engine'), words('enigma.engine.results'))
+    assert not topic_matches(words('enigma.*'), words('enigma'))
+
+# Drains a router queue into a list of routing keys
+def drain(router: LocalRouter, name: str) -> list[str]:
+    keys = []
+    while True:
+        try:
+            routing_key, properties, body = router.get_queue(name).get_nowait()
+        except queue.Empty:
+            return keys
+        keys.append(routing_key)
+
+def test_router_delivers_to_every_matching_queue_once():
+    router = LocalRouter()
+    router.declare_exchange('enigma', 'topic')
+    results = router.declare_queue('results')
+    everything = router.declare_queue('')
+    router.bind_queue('enigma', results, 'enigma.engine.results')
+    router.bind_queue('enigma', everything, 'enigma.#')
+    router.bind_queue('enigma', everything, 'enigma.*.results')
+
+    router.publish('enigma', 'enigma.engine.results', b'1')
+    router.publish('enigma', 'enigma.checks.tasks', b'2')
+    router.publish('enigma', 'other.engine.results', b'3')
+
+    assert drain(router, results) == ['enigma.engine.results']
+    assert drain(router, everything) == ['enigma.engine.results', 'enigma.checks.tasks']
+
+def test_router_routes_follow_binding_changes():
+    router = LocalRouter()
+    first = router.declare_queue('first')
+    router.bind_queue('enigma', first, 'enigma.engine.results')
+    router.publish('enigma', 'enigma.engine.results', b'1')
+
+    # Cached routes must pick up a queue bound after the first publish, and drop a deleted one
+    second = router.declare_queue('second')
+    router.bind_queue('enigma', second, 'enigma.engine.*')
+    router.publish('enigma', 'enigma.engine.results', b'2')
+    router.delete_queue(first)
+    router.publish('enigma', 'enigma.engine.results', b'3')
+
+    assert drain(router, second) == ['enigma.engine.results', 'enigma.engine.results']
+    assert first not in router.queues
+
+def test_router_default_exchange_goes_to_named_queue():
+    router = LocalRouter()
+    name = router.declare_queue('direct')
+    router.publish('', 'direct', b'1')
+    router.publish('', 'missing', b'2')
+    assert drain(router, name) == ['direct']
+
+def test_local_broker_consumes_bound_messages():
+    received = []
+    with Broker.new() as broker:
+        result = broker.channel.queue_declare('', exclusive=True)
+        broker.channel.queue_bind(exchange='enigma', queue=result.method.queue, routing_key='enigma.engine.*')
+
+        def on_message(channel, method, properties, body):
+            received.append((method.routing_key, body))
+            if len(received) == 2:
+                channel.stop_consuming()
+
+        broker.channel.basic_consume(queue=result.method.queue, on_message_callback=on_message)
+        broker.channel.basic_publish(exchange='enigma', routing_key='enigma.engine.results', body='a')
+        broker.channel.basic_publish(exchange='enigma', routing_key='enigma.checks.tasks', body='b')
+        broker.channel.basic_publish(exchange='enigma', routing_key='enigma.engine.stop', body='c')
+        timer = broker.connection.call_later(5, broker.channel.stop_consuming)
+        broker.channel.start_consuming()
+        broker.connection.remove_timeout(timer)
+
+    assert received == [('enigma.engine.results', b'a'), ('enigma.engine.stop', b'c')]
@@ -0,0 +1,54 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import numpy as np
+
+from enigma.engine import checkpoint_path
+from enigma.engine.checkpoint import Checkpoint
+from enigma.engine.database import db_engine
+from enigma.engine.scoreboard import ScoreBoard
+from enigma.engine.scoring import RvBScoringEngine
+
+def test_checkpoint_round_trip(tmp_path):
+    scoreboard = ScoreBoard([1, 2, 3], ['box1.ssh', 'box1.http'])
+    rng = np.random.default_rng(0)
+    for round in range(12):
+        scoreboard.apply_round(scoreboard.services, rng.random((3, 2)) < 0.5, 10, 100, 3)
+    scoreboard.set_inject_points(2, 7, 40)
+    watermark = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+    Checkpoint.new(12, scoreboard, watermark).write(str(tmp_path))
+    checkpoint = Checkpoint.read(str(tmp_path))
+    restored = ScoreBoard([1, 2, 3], [])
+    checkpoint.restore(restored)
+
+    assert checkpoint.round == 12
+    assert checkpoint.inject_watermark == watermark
+    assert restored.services == scoreboard.services
+    assert restored.injects == scoreboard.injects
+    for field in ('points', 'penalties', 'sla_tracker', 'inject_points'):
+        assert np.array_equal(getattr(restored, field), getattr(scoreboard, field)), field
+
+def test_resume_carries_on_from_checkpoint(competition):
+    competition(teams=3, boxes=1, services=2, pass_rate=0.6, seed=2)
+    engine = RvBScoringEngine()
+    engine.run(3)
+    total_scores = engine.scoreboard.total_scores().tolist()
+
+    resumed = RvBScoringEngine()
+    assert resumed.resume()
+    assert resumed.round == 4
+    assert resumed.scoreboard.total_scores().tolist() == total_scores
+
+def test_resume_refuses_checkpoint_for_another_round(competition):
+    competition(teams=3, boxes=1, services=2, pass_rate=0.6, seed=2)
+    engine = RvBScoringEngine()
+    engine.run(3)
+
+    # The checkpoint is for round 3, but the DB now ends at round 2, as after a restore of an older backup
+    connection = sqlite3.connect(db_engine.url.database)
+    connection.execute('DELETE FROM roundresults WHERE round = 3')
+    connection.commit()
+
+    assert Checkpoint.read(checkpoint_path).round == 3
+    assert not RvBScoringEngine().resume()
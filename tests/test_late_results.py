@@ -0,0 +1,66 @@
+import numpy as np
+
+import enigma.engine.scoring as scoring
+from enigma.broker import Broker
+from enigma.run_check import parse_check_data, publish_result, decode_result
+from enigma.models.roundresults import RoundResults
+
+# Stands in for the check workers, publishing results straight to the broker instead of running checks
+# Every check first gets a passing result tagged with the round before, as a slow check left over from
+# that round would send, and then its real result, a failure
+class LateResultExecutor:
+
+    def __init__(self):
+        self.next_id = 0
+
+    def start(self):
+        pass
+
+    def submit(self, check_data: list[list[str]], check_timeout: int, round: int) -> list[int]:
+        task_ids = []
+        with Broker.new() as broker:
+            for data in check_data:
+                full_service_name, team, addr, args = parse_check_data(data)
+                publish_result(broker, round - 1, team, full_service_name, (True, 'late pass'))
+                publish_result(broker, round, team, full_service_name, (False, 'failed'))
+                task_ids.append(self.next_id)
+                self.next_id = self.next_id + 1
+        return task_ids
+
+    def cancel(self, task_ids: list[int]):
+        pass
+
+    def recycle(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_result_carries_its_round():
+    with Broker.new() as broker:
+        result = broker.channel.queue_declare('', exclusive=True)
+        broker.channel.queue_bind(exchange='enigma', queue=result.method.queue, routing_key='enigma.engine.results')
+        bodies = []
+
+        def on_message(channel, method, properties, body):
+            bodies.append(body)
+            channel.stop_consuming()
+
+        broker.channel.basic_consume(queue=result.method.queue, on_message_callback=on_message)
+        publish_result(broker, 7, 3, 'box1.ssh', (True, 'Logged in | ok'))
+        broker.channel.start_consuming()
+
+    assert decode_result(bodies[0]) == (7, [3, 'box1.ssh', True, 'Logged in | ok'])
+
+def test_late_results_from_earlier_round_are_dropped(competition, monkeypatch):
+    competition(teams=3, boxes=1, services=2)
+    monkeypatch.setattr(scoring, 'create_check_executor', lambda settings: LateResultExecutor())
+
+    engine = scoring.RvBScoringEngine()
+    engine.run(2)
+
+    rounds = list(RoundResults.stream())
+    assert [round_results.round for round_results in rounds] == [1, 2]
+    for round_results in rounds:
+        assert round_results.results.shape == (3, 2)
+        assert not np.any(round_results.results)
@@ -0,0 +1,59 @@
+import sqlite3
+
+from enigma.engine.database import db_engine
+from enigma.engine.scoring import RvBScoringEngine
+from enigma.models.roundresults import RoundResults
+
+queries = {
+    'scores': 'SELECT team_id, round, score FROM scorereports',
+    'index': 'SELECT round, team_id, total_score, raw_score, penalty_score, services FROM scoreindex',
+    'sla': 'SELECT team_id, round, service FROM slareports',
+    'teams': 'SELECT identifier, score FROM teams'
+}
+
+def read_tables(connection: sqlite3.Connection) -> dict[str: list]:
+    return {table: sorted(connection.execute(query).fetchall()) for table, query in queries.items()}
+
+def connect() -> sqlite3.Connection:
+    return sqlite3.connect(db_engine.url.database)
+
+def test_rescore_reproduces_incremental_scores(competition):
+    competition(teams=5, boxes=2, services=2, pass_rate=0.5, seed=3)
+    engine = RvBScoringEngine()
+    engine.run(8)
+    connection = connect()
+
+    # Team 2 was awarded inject points during round 4, which only its later rounds include
+    connection.execute('UPDATE scoreindex SET raw_score = raw_score + 50, total_score = total_score + 50 WHERE team_id = 2 AND round >= 4')
+    connection.execute('UPDATE scorereports SET score = score + 50 WHERE team_id = 2 AND round >= 4')
+    connection.execute('UPDATE teams SET score = score + 50 WHERE identifier = 2')
+    connection.commit()
+    engine.scoreboard.set_inject_points(2, 1, 50)
+    before = read_tables(connection)
+    total_scores = engine.scoreboard.total_scores().tolist()
+
+    engine.rescore()
+
+    assert before['sla'], 'the run should have had SLA violations to replay'
+    assert read_tables(connection) == before
+    assert engine.scoreboard.total_scores().tolist() == total_scores
+
+def test_rescore_excluded_round_carries_previous_totals(competition):
+    competition(teams=3, boxes=1, services=2, pass_rate=0.7, seed=1)
+    engine = RvBScoringEngine()
+    engine.run(5)
+
+    assert RoundResults.set_excluded(3, True)
+    engine.rescore()
+
+    connection = connect()
+    index = {(team_id, round): total for round, team_id, total in connection.execute(
+        'SELECT round, team_id, total_score FROM scoreindex'
+    )}
+    scores = {(team_id, round): score for team_id, round, score in connection.execute(
+        'SELECT team_id, round, score FROM scorereports'
+    )}
+    assert scores == index
+    for team_id in (1, 2, 3):
+        assert index[(team_id, 3)] == index[(team_id, 2)]
+    assert not connection.execute('SELECT count(*) FROM slareports WHERE round = 3').fetchone()[0]
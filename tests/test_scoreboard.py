@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from enigma.engine.scoreboard import ScoreBoard
+
+# The per-team tabulation the scoreboard replaced, kept here as the reference for its SLA semantics
+# A failure with no streak starts one at 1 without checking the requirement, so the two only agree for a
+# requirement of 2 or more, which is what the settings are used with
+class PerTeamReference:
+
+    def __init__(self, services: list[str]):
+        self.scores = dict.fromkeys(services, 0)
+        self.penalty_scores = dict.fromkeys(services, 0)
+        self.sla_tracker = dict.fromkeys(services, 0)
+
+    def tabulate_scores(self, reports: dict[str: bool], check_points: int, sla_penalty: int,
+                        sla_requirement: int) -> list[str]:
+        violations = []
+        for service, result in reports.items():
+            if result:
+                self.scores[service] = self.scores[service] + check_points
+                self.sla_tracker[service] = 0
+            elif self.sla_tracker[service] == 0:
+                self.sla_tracker[service] = 1
+            elif self.sla_tracker[service] >= sla_requirement - 1:
+                self.penalty_scores[service] = self.penalty_scores[service] + sla_penalty
+                self.sla_tracker[service] = 0
+                violations.append(service)
+            else:
+                self.sla_tracker[service] = self.sla_tracker[service] + 1
+        return violations
+
+@pytest.mark.parametrize('sla_requirement', [2, 3, 5])
+def test_sla_streaks_match_per_team_tabulation(sla_requirement):
+    rng = np.random.default_rng(sla_requirement)
+    team_ids = [1, 2, 3, 4, 5]
+    services = ['box1.ssh', 'box1.http', 'box2.tcp', 'box2.https']
+    check_points = 10
+    sla_penalty = 100
+
+    scoreboard = ScoreBoard(team_ids, services)
+    references = {team_id: PerTeamReference(services) for team_id in team_ids}
+
+    for round in range(200):
+        # Some rounds only check some services, which must leave the other streaks alone
+        round_services = [service for service in services if rng.random() < 0.8] or services
+        results = rng.random((len(team_ids), len(round_services))) < 0.4
+
+        violations = scoreboard.apply_round(round_services, results, check_points, sla_penalty, sla_requirement)
+
+        for i, team_id in enumerate(team_ids):
+            reports = dict(zip(round_services, results[i].tolist()))
+            expected = references[team_id].tabulate_scores(reports, check_points, sla_penalty, sla_requirement)
+            assert [service for service, violated in zip(round_services, violations[i]) if violated] == expected
+
+    for i, team_id in enumerate(team_ids):
+        reference = references[team_id]
+        columns = [scoreboard.service_index[service] for service in services]
+        assert scoreboard.points[i, columns].tolist() == [reference.scores[service] for service in services]
+        assert scoreboard.penalties[i, columns].tolist() == [reference.penalty_scores[service] for service in services]
+        assert scoreboard.sla_tracker[i, columns].tolist() == [reference.sla_tracker[service] for service in services]